@@ -0,0 +1,228 @@
+"""
+Monthly archive partitions of the outage history.
+
+Snapshots from months that have ended are moved out of the hot database into one
+SQLite file per month next to it (outages_db-2024-11, ...), which is then vacuumed
+and made read-only. The snapshots manifest stays in the hot database and records
+the partition of every archived snapshot, so as-of queries attach only the months
+they need, and latest-snapshot queries never touch cold data. Each company's latest
+snapshot and interval-mode history are never archived. The outage_changes log is not
+partitioned: entries older than CHANGES_RETENTION_DAYS are deleted instead, as
+/outages/changes pollers only follow it from recent offsets.
+
+Run monthly (see systemd/archive.timer):
+
+    python3 archive.py [db_file]
+"""
+from datetime import datetime, timedelta, timezone
+import itertools
+import os
+import re
+import sqlite3
+import sys
+
+import outage_store
+
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+CHANGES_RETENTION_DAYS = 31  # Changelog entries older than this are pruned
+PRUNE_BATCH_SIZE = 10000  # Changelog entries deleted per transaction
+
+PARTITION_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {schema}.outages (
+        id TEXT,
+        municipality TEXT,
+        area TEXT,
+        cause TEXT,
+        numCustomersOut INTEGER,
+        crewStatusDescription TEXT,
+        latitude REAL,
+        longitude REAL,
+        dateOff TEXT,
+        crewEta TEXT,
+        polygon TEXT,
+        company TEXT,
+        planned INTEGER DEFAULT 0,
+        apiCallTimestamp TEXT,
+        geometry TEXT,
+        polygonLayout INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.idx_outages_company_timestamp
+        ON outages (company, apiCallTimestamp);
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.outage_extents USING rtree(
+        id,
+        minLon, maxLon,
+        minLat, maxLat
+    );
+"""
+
+# Snapshot-mode snapshots of a month that aren't their company's latest
+_ARCHIVABLE_SNAPSHOTS = """
+    SELECT s.company, s.apiCallTimestamp
+    FROM snapshots s
+    WHERE substr(s.apiCallTimestamp, 1, 7) = ? AND s.partitionMonth IS NULL AND NOT s.intervals
+      AND s.apiCallTimestamp < (SELECT MAX(apiCallTimestamp) FROM snapshots WHERE company = s.company)
+"""
+
+
+def partition_path(db_file, month):
+    """File of the archive partition for a "YYYY-MM" month."""
+    return f"{db_file}-{month}"
+
+
+def schema_name(month):
+    """Name a partition is attached under; raises ValueError for anything but "YYYY-MM"."""
+    if not MONTH_PATTERN.match(month or ""):
+        raise ValueError(f"Invalid partition month: {month!r}")
+    return "archive_" + month.replace("-", "_")
+
+
+def attach_partitions(conn, db_file, months):
+    """
+    Attach the partitions of `months` read-only to a connection opened with uri=True.
+    Returns {month: schema name} for outage_store.outages_query.
+    """
+    attached = {}
+    for month in months:
+        schema = schema_name(month)
+        conn.execute("ATTACH DATABASE ? AS " + schema, (f"file:{partition_path(db_file, month)}?mode=ro",))
+        attached[month] = schema
+    return attached
+
+
+def detach_partitions(conn, attached):
+    for schema in attached.values():
+        conn.execute("DETACH DATABASE " + schema)
+
+
+def archivable_months(conn, current_month):
+    """Months before `current_month` that still have snapshots in the hot database."""
+    return [month for (month,) in conn.execute(
+        """
+        SELECT DISTINCT substr(apiCallTimestamp, 1, 7) AS month FROM snapshots
+        WHERE partitionMonth IS NULL AND NOT intervals AND month < ?
+        ORDER BY month
+        """,
+        (current_month,),
+    )]
+
+
+def _archive_batch(conn, schema, month, snapshots):
+    """Move one batch of snapshots into an attached partition; returns the number of rows moved."""
+    columns = ", ".join(outage_store.STORED_COLUMNS)
+    # Only the partition is written here, so scrapers keep committing to the hot database meanwhile
+    with conn:
+        conn.execute("DELETE FROM archiving")
+        conn.executemany("INSERT INTO archiving VALUES (?, ?)", snapshots)
+        # Rowids are kept so the copied extents still point at their rows
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {schema}.outages (rowid, {columns})
+            SELECT o.rowid, {', '.join('o.' + column for column in outage_store.STORED_COLUMNS)}
+            FROM archiving a
+            JOIN outages o ON o.company = a.company AND o.apiCallTimestamp = a.apiCallTimestamp
+        """)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {schema}.outage_extents (id, minLon, maxLon, minLat, maxLat)
+            SELECT e.id, e.minLon, e.maxLon, e.minLat, e.maxLat
+            FROM archiving a
+            JOIN outages o ON o.company = a.company AND o.apiCallTimestamp = a.apiCallTimestamp
+            JOIN outage_extents e ON e.id = o.rowid
+        """)
+    # The hot database's write lock is only held for one batch's deletes
+    with conn:
+        rowids = [rowid for (rowid,) in conn.execute(
+            """
+            SELECT o.rowid FROM archiving a
+            JOIN outages o ON o.company = a.company AND o.apiCallTimestamp = a.apiCallTimestamp
+            """
+        )]
+        outage_store.delete_outage_rows(conn, rowids)
+        conn.execute(
+            """
+            UPDATE snapshots SET partitionMonth = ?
+            WHERE (company, apiCallTimestamp) IN (SELECT company, apiCallTimestamp FROM archiving)
+            """,
+            (month,),
+        )
+    return len(rowids)
+
+
+def archive_month(conn, db_file, month):
+    """
+    Move one month's archivable snapshots into its partition, a day at a time. Each day's
+    rows are copied and committed first, then deleted from the hot database together with
+    marking the manifest, so scrapers only wait for one day's deletes and an interrupted
+    run is simply repeated. Returns the number of rows moved.
+    """
+    snapshots = conn.execute(_ARCHIVABLE_SNAPSHOTS, (month,)).fetchall()
+    if not snapshots:
+        return 0
+    path = partition_path(db_file, month)
+    if os.path.exists(path):
+        os.chmod(path, 0o644)  # Writable again while this month is added to
+    schema = schema_name(month)
+    conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+    try:
+        conn.executescript(PARTITION_SCHEMA.format(schema=schema))
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS archiving (company TEXT, apiCallTimestamp TEXT)")
+        moved = 0
+        by_day = sorted(snapshots, key=lambda snapshot: snapshot[1])
+        for _, day in itertools.groupby(by_day, key=lambda snapshot: snapshot[1][:10]):
+            moved += _archive_batch(conn, schema, month, list(day))
+    finally:
+        conn.execute("DETACH DATABASE " + schema)
+
+    partition = sqlite3.connect(path)
+    try:
+        partition.execute("VACUUM")
+    finally:
+        partition.close()
+    os.chmod(path, 0o444)
+    return moved
+
+
+def archive_partitions(db_file=outage_store.DB_FILE, now=None):
+    """Archive every ended month still in the hot database. Returns {month: rows moved}."""
+    current_month = (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+    conn = outage_store.connect(db_file)
+    try:
+        return {month: archive_month(conn, db_file, month) for month in archivable_months(conn, current_month)}
+    finally:
+        conn.close()
+
+
+def prune_changes(db_file=outage_store.DB_FILE, now=None):
+    """
+    Delete the outage_changes log up to its last entry from before CHANGES_RETENTION_DAYS
+    ago, oldest first and in batches, so scrapers only wait for one batch. Offsets keep
+    increasing, so pollers past the pruned entries are unaffected. Returns how many were deleted.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=CHANGES_RETENTION_DAYS)
+    conn = outage_store.connect(db_file)
+    try:
+        (last_offset,) = conn.execute(
+            "SELECT MAX(id) FROM outage_changes WHERE apiCallTimestamp < ?", (cutoff.strftime("%Y-%m-%dT%H:%M:%S"),)
+        ).fetchone()
+        deleted = 0
+        while last_offset is not None:
+            with conn:
+                batch = conn.execute(
+                    """
+                    DELETE FROM outage_changes WHERE id IN (
+                        SELECT id FROM outage_changes WHERE id <= ? ORDER BY id LIMIT ?
+                    )
+                    """,
+                    (last_offset, PRUNE_BATCH_SIZE),
+                ).rowcount
+            deleted += batch
+            if batch < PRUNE_BATCH_SIZE:
+                break
+        return deleted
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else outage_store.DB_FILE
+    for month, moved in archive_partitions(db_file).items():
+        print(f"Archived {moved} rows to {partition_path(db_file, month)}")
+    print(f"Pruned {prune_changes(db_file)} outage changes")
@@ -0,0 +1,326 @@
+"""
+HTTP load benchmark of the API against a local fixture database.
+
+Builds (or reuses) a fixture outages database made of FIXTURE_SNAPSHOTS scraper runs
+of every company in outages_cache.json, starts the app on it with uvicorn in a
+subprocess, then drives each endpoint at every requested concurrency and reports
+p50/p95/p99 latency, throughput and the server's memory. Results are written to a
+JSON file; pass an earlier one as --baseline to see the change against it.
+
+    python3 benchmark.py [--db FIXTURE_DB] [--concurrency 1 8 32] [--requests 500]
+        [--endpoint outages ...] [--output results.json] [--baseline previous.json]
+
+Only the standard library is used on the client side, so the numbers measure the
+server rather than a client library.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import outage_store
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(HERE, "outages_cache.json")
+ALERTS_FILE = os.path.join(HERE, "weather_api", "matched_weather_alerts_with_polygons.json")
+
+FIXTURE_SNAPSHOTS = 48  # Scraper runs per company, 5 minutes apart
+FIXTURE_INTERVAL = timedelta(minutes=5)
+FIXTURE_END = datetime(2025, 1, 1, tzinfo=timezone.utc)  # Fixed, so fixtures and as-of lookups are reproducible
+
+# {name: path}; {as_of} is the fixture's middle snapshot
+ENDPOINTS = {
+    "preloaded-outages": "/preloaded-outages",
+    "outages": "/outages",
+    "outages-as-of": "/outages?timestamp={as_of}",
+    "weather-alerts": "/weather-alerts",
+}
+ACCEPT_ENCODING = "gzip, deflate, br"  # What browsers send
+READY_TIMEOUT = 60  # Seconds to wait for the server to load the fixture into its cache
+
+
+def outage_row(outage, api_call_timestamp):
+    """A row in outage_store.OUTAGE_COLUMNS order from an outage in API shape."""
+    return (
+        outage["id"], outage["municipality"], outage["area"], outage["cause"], outage["num_customers"],
+        outage["crew_status"], outage["latitude"], outage["longitude"], outage["date_off"],
+        outage["crew_eta"], outage["polygon"], outage["power_company"], outage["planned"],
+        api_call_timestamp,
+    )
+
+
+def load_cached_outages(path=CACHE_FILE):
+    """The outages of a cache file written by main.save_cache_to_file, by company."""
+    with open(path, encoding="utf-8") as cache_file:
+        data = json.load(cache_file).get("data", [])
+    companies = {}
+    for outage in data:
+        companies.setdefault(outage["power_company"], []).append(outage)
+    return companies
+
+
+def build_fixture(db_file, snapshots=FIXTURE_SNAPSHOTS, seed=0):
+    """
+    Write `snapshots` runs of every company in outages_cache.json to db_file through the
+    scrapers' write path, with customer counts varying from run to run.
+    """
+    rng = random.Random(seed)
+    companies = load_cached_outages()
+    conn = outage_store.connect(db_file)
+    try:
+        for step in range(snapshots):
+            api_call_timestamp = (FIXTURE_END - FIXTURE_INTERVAL * (snapshots - 1 - step)).isoformat()
+            for company, outages in sorted(companies.items()):
+                rows = []
+                for outage in outages:
+                    row = outage_row(outage, api_call_timestamp)
+                    try:
+                        customers = max(1, int(int(row[4]) * rng.uniform(0.8, 1.2)))
+                    except (TypeError, ValueError):
+                        customers = row[4]
+                    rows.append(row[:4] + (customers,) + row[5:])
+                outage_store.store_snapshot(conn, company, rows, api_call_timestamp)
+    finally:
+        conn.close()
+
+
+def fixture_as_of(db_file):
+    """The timestamp of a database's middle snapshot, for as-of lookups."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        (count,) = conn.execute("SELECT COUNT(DISTINCT apiCallTimestamp) FROM snapshots").fetchone()
+        row = conn.execute(
+            "SELECT DISTINCT apiCallTimestamp FROM snapshots ORDER BY apiCallTimestamp LIMIT 1 OFFSET ?",
+            (count // 2,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else FIXTURE_END.isoformat()
+
+
+def serve(db_file, port, cache_file):
+    """Run the app on a fixture database; the benchmark starts this in a subprocess."""
+    import uvicorn
+
+    import main
+
+    main.DB_PATH = db_file
+    main.CACHE_FILE_PATH = cache_file
+    main.ALERTS_FILE = ALERTS_FILE
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server_memory(pid):
+    """Current and peak resident memory of a process in MiB, from /proc (Linux only)."""
+    memory = {"rss_mib": None, "peak_rss_mib": None}
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key == "VmRSS":
+                    memory["rss_mib"] = round(int(value.split()[0]) / 1024, 1)
+                elif key == "VmHWM":
+                    memory["peak_rss_mib"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+
+def _wait_until_ready(port, process):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/preloaded-outages")
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200 and response.getheader("X-Cache-Status") != "stale":
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server didn't load the fixture in time")
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _worker(port, path, count):
+    """Send `count` requests over one keep-alive connection; returns (latencies, bytes, errors)."""
+    latencies, received, errors = [], 0, 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"Accept-Encoding": ACCEPT_ENCODING})
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                continue
+            latencies.append(time.perf_counter() - started)
+            received += len(body)
+            if response.status != 200:
+                errors += 1
+    finally:
+        conn.close()
+    return latencies, received, errors
+
+
+def run_load(port, path, concurrency, requests):
+    """Send `requests` GETs of a path from `concurrency` connections at once."""
+    counts = [requests // concurrency + (1 if worker < requests % concurrency else 0) for worker in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda count: _worker(port, path, count), counts))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for worker_latencies, _, _ in results for latency in worker_latencies)
+    received = sum(worker_received for _, worker_received, _ in results)
+    errors = sum(worker_errors for _, _, worker_errors in results)
+
+    def milliseconds(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": milliseconds(percentile(latencies, 50)),
+        "p95_ms": milliseconds(percentile(latencies, 95)),
+        "p99_ms": milliseconds(percentile(latencies, 99)),
+        "max_ms": milliseconds(latencies[-1] if latencies else None),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "bytes_per_response": round(received / len(latencies)) if latencies else None,
+    }
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(db_file, endpoints, concurrency_levels, requests, warmup):
+    """Start the server on db_file and measure every endpoint at every concurrency level."""
+    port = _free_port()
+    cache_dir = tempfile.mkdtemp(prefix="ohub-bench-")
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--db", db_file, "--port", str(port),
+         "--cache-file", os.path.join(cache_dir, "outages_cache.json")],
+        cwd=HERE,
+    )
+    results = []
+    as_of = fixture_as_of(db_file)
+    try:
+        _wait_until_ready(port, process)
+        for name in endpoints:
+            path = ENDPOINTS[name].format(as_of=urllib.parse.quote(as_of))
+            _worker(port, path, warmup)
+            for concurrency in concurrency_levels:
+                result = {"endpoint": name, "path": path, "concurrency": concurrency}
+                result.update(run_load(port, path, concurrency, requests))
+                result.update(_server_memory(process.pid))
+                results.append(result)
+                print(
+                    f"{name:<18} c={concurrency:<4} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                    f"p99={result['p99_ms']}ms {result['throughput_rps']} req/s "
+                    f"rss={result['rss_mib']}MiB errors={result['errors']}"
+                )
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+
+def compare(results, baseline):
+    """Print the change of each result's latency and throughput against a baseline run."""
+    previous = {(result["endpoint"], result["concurrency"]): result for result in baseline["results"]}
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} ({baseline.get('started')}):")
+    for result in results:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key]:+.1%}")
+        print(f"{result['endpoint']:<18} c={result['concurrency']:<4} " + " ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API against a local fixture database.")
+    parser.add_argument("--db", help="Fixture database; built here if missing, in a temp dir if not given")
+    parser.add_argument("--snapshots", type=int, default=FIXTURE_SNAPSHOTS, help="Runs per company in a new fixture")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests per endpoint before measuring")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS), help="Repeat; default all")
+    parser.add_argument("--output", help="Results file (default benchmark-<UTC time>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--cache-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.db, args.port, args.cache_file)
+        sys.exit(0)
+
+    started = datetime.now(timezone.utc)
+    db_file = args.db or os.path.join(tempfile.mkdtemp(prefix="ohub-bench-"), "outages_db")
+    if not os.path.exists(db_file):
+        print(f"Building fixture database {db_file} ({args.snapshots} snapshots per company)")
+        build_fixture(db_file, args.snapshots)
+    results = run_benchmark(
+        db_file, args.endpoint or list(ENDPOINTS), args.concurrency, args.requests, args.warmup
+    )
+    report = {
+        "started": started.isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "db": db_file,
+        "requests": args.requests,
+        "results": results,
+    }
+    output = args.output or f"benchmark-{started:%Y%m%dT%H%M%SZ}.json"
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results saved to {output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            compare(results, json.load(baseline_file))
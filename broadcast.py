@@ -0,0 +1,100 @@
+"""
+Server-Sent Events fan-out of outage cache updates for /outages/stream.
+
+Every cache refresh that changes data is turned into one compact diff, encoded
+once as an SSE message and handed to all connected clients' queues as the same
+bytes object, so an idle connection costs nothing but a queue slot. Message ids are
+the broadcaster's version; a client that connects without the current one in
+Last-Event-ID is sent a resync first, as it may have missed diffs.
+"""
+import asyncio
+
+import outage_store
+
+QUEUE_SIZE = 16  # Messages buffered per client before it is asked to resync
+KEEPALIVE_INTERVAL = 30  # Seconds between comment lines that keep proxies from closing idle streams
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def diff_outages(old_rows, new_rows):
+    """
+    Compare one company's previous and current outages by id. Returns the outages that
+    were added or changed, and the ids that disappeared.
+    """
+    old_by_id = {outage["id"]: outage for outage in old_rows}
+    new_ids = set()
+    upserts = []
+    for outage in new_rows:
+        new_ids.add(outage["id"])
+        before = old_by_id.get(outage["id"])
+        # time_stamp changes on every scraper run, so leave it out of the comparison
+        if before is None or {**before, "time_stamp": None} != {**outage, "time_stamp": None}:
+            upserts.append(outage)
+    removed = [outage_id for outage_id in old_by_id if outage_id not in new_ids]
+    return upserts, removed
+
+
+def encode_event(event_id, payload, event="outages"):
+    """Encode a JSON payload as one SSE message."""
+    data = outage_store.payload_json(payload)
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+def resync_event(version):
+    """Tell a client to reload /preloaded-outages; the id is the version that data is at."""
+    return encode_event(version, {}, "resync")
+
+
+class Broadcaster:
+    """Hands each published message to every subscriber's bounded queue."""
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.version = 0
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, upserts, removed):
+        """Encode one diff and queue it for every subscriber."""
+        self.version += 1
+        message = encode_event(self.version, {"upserts": upserts, "removed": removed})
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow client gets a resync marker instead of an ever-growing backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(resync_event(self.version))
+
+    async def stream(self, last_event_id=None):
+        """
+        Subscribe and yield SSE bytes until the client disconnects. A client whose
+        Last-Event-ID isn't the current version starts with a resync.
+        """
+        # Subscribed only once the response starts, so a stream that never runs holds no queue
+        queue = self.subscribe()
+        # Later diffs are in the queue, so only this version decides whether the client missed any
+        version = self.version
+        try:
+            yield b"retry: 5000\n\n"
+            if last_event_id != str(version):
+                yield resync_event(version)
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+        finally:
+            self.unsubscribe(queue)
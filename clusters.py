@@ -0,0 +1,102 @@
+"""
+Zoom-aware clustering of outage points for the /clusters endpoint.
+
+Clusters are built once per cache refresh with a hierarchical grid: starting from
+one cluster per outage at MAX_ZOOM + 1, every lower zoom level groups the clusters
+of the level above by the Web Mercator grid cell (CLUSTER_RADIUS pixels wide) their
+centroid falls into. A zoomed-out map then costs one small list of clusters.
+"""
+import math
+
+import outage_store
+
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+CLUSTER_RADIUS = 60  # Cell size in screen pixels
+TILE_SIZE = 256
+
+
+def mercator_x(lon):
+    return lon / 360.0 + 0.5
+
+
+def mercator_y(lat):
+    sin_lat = math.sin(math.radians(max(min(lat, 85.05112878), -85.05112878)))
+    return 0.5 - 0.25 * math.log((1 + sin_lat) / (1 - sin_lat)) / math.pi
+
+
+def mercator_lon(x):
+    return (x - 0.5) * 360.0
+
+
+def mercator_lat(y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+def build_clusters(data, extents):
+    """
+    Cluster the cached outages for every zoom level.
+
+    `extents` is the per-outage bounding box list from the cache; an outage's point is
+    the centre of its extent. Returns {zoom: [cluster, ...]} where each cluster is a dict
+    with longitude, latitude, count and num_customers (plus id and power_company when
+    it holds a single outage).
+    """
+    # Each working cluster: [x, y, count, num_customers, outage or None]
+    level = []
+    for outage, extent in zip(data, extents):
+        if not extent:
+            continue
+        lon = (extent[0] + extent[2]) / 2
+        lat = (extent[1] + extent[3]) / 2
+        level.append([mercator_x(lon), mercator_y(lat), 1, outage_store.customer_count(outage.get("num_customers")), outage])
+
+    by_zoom = {}
+    for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+        cell = CLUSTER_RADIUS / (TILE_SIZE * 2 ** zoom)
+        cells = {}
+        for x, y, count, customers, outage in level:
+            key = (int(x / cell), int(y / cell))
+            merged = cells.get(key)
+            if merged is None:
+                cells[key] = [x * count, y * count, count, customers, outage]
+            else:
+                merged[0] += x * count
+                merged[1] += y * count
+                merged[2] += count
+                merged[3] += customers
+                merged[4] = None
+        level = [
+            [sum_x / count, sum_y / count, count, customers, outage]
+            for sum_x, sum_y, count, customers, outage in cells.values()
+        ]
+        by_zoom[zoom] = [_as_dict(cluster) for cluster in level]
+    return by_zoom
+
+
+def _as_dict(cluster):
+    x, y, count, customers, outage = cluster
+    entry = {
+        "longitude": round(mercator_lon(x), 6),
+        "latitude": round(mercator_lat(y), 6),
+        "count": count,
+        "num_customers": customers,
+    }
+    if outage is not None:
+        entry["id"] = outage["id"]
+        entry["power_company"] = outage["power_company"]
+    return entry
+
+
+def clusters_for(by_zoom, zoom, bbox=None):
+    """The clusters for a zoom level (clamped to the built range), optionally within a bbox."""
+    if not by_zoom:
+        return []
+    clusters = by_zoom[max(MIN_ZOOM, min(MAX_ZOOM, zoom))]
+    if bbox is None:
+        return clusters
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return [
+        cluster for cluster in clusters
+        if min_lon <= cluster["longitude"] <= max_lon and min_lat <= cluster["latitude"] <= max_lat
+    ]
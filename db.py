@@ -0,0 +1,313 @@
+"""
+Async read access to the outages database for the FastAPI app.
+
+Queries run on a small pool of worker threads, each borrowing one of a bounded set
+of read-only SQLite connections that are reused across requests. Route handlers
+await the typed query functions below and never touch sqlite3 on the event loop.
+Streamed responses read one page per query and hold no connection in between, and
+only STREAM_POOL_SIZE of the connections serve them at once, so slow clients can't
+starve the cache refresher or short queries.
+"""
+import asyncio
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, FrozenSet, Iterator, NamedTuple, Optional, Tuple
+
+import archive
+import export
+import metrics
+import outage_store
+
+POOL_SIZE = 4
+STREAM_POOL_SIZE = 2  # Connections streams may use at once; the rest stay free for other queries
+STREAM_PAGE_SIZE = 500  # Rows fetched per query when streaming
+
+QUERY_SECONDS = metrics.Histogram(
+    "ohub_db_query_duration_seconds", "Time spent on a worker thread running a database query.", ["query"],
+)
+
+Outage = dict[str, Any]
+BBox = Tuple[float, float, float, float]  # minLon, minLat, maxLon, maxLat
+Cursor = Tuple[str, int]  # company and row key of the last outage of a page
+
+
+class OutageFilter(NamedTuple):
+    """Filters, projection and paging of an outages query, all applied in SQL."""
+
+    companies: Tuple[str, ...] = ()
+    planned: Optional[bool] = None
+    min_customers: Optional[int] = None
+    fields: Optional[FrozenSet[str]] = None  # outage_store.OUTAGE_FIELDS to return; None for all
+    after: Optional[Cursor] = None
+    limit: Optional[int] = None
+
+
+NO_FILTER = OutageFilter()
+
+
+class ReadPool:
+    """A fixed number of read-only connections, each used by one worker thread at a time."""
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE, stream_size: int = STREAM_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        # Held for as long as a connection is borrowed, so at most `size` exist
+        self._slots = asyncio.Semaphore(size)
+        # Taken before a slot by stream pages, leaving size - stream_size slots for everything else
+        self._stream_slots = asyncio.Semaphore(min(stream_size, size))
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ohub-db")
+        # PRAGMA data_version is per connection, so change detection keeps its own
+        self._watch: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        # Runs on a worker thread, as opening a connection reads the database file
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def _call(self, fn: Callable, args: tuple):
+        conn = self._acquire()
+        started = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - started, query=fn.__name__.lstrip("_"))
+            self._idle.put(conn)
+
+    def _data_version(self) -> int:
+        if self._watch is None:
+            self._watch = self._open()
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    async def data_version(self) -> int:
+        """A counter that changes whenever another connection commits to the database."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._data_version)
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(conn, *args) on a worker thread with a pooled connection."""
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def run_stream_page(self, fn: Callable, *args):
+        """Run fn(conn, *args) like `run`, for one page of a streamed response or another long read."""
+        async with self._stream_slots:
+            return await self.run(fn, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+        if self._watch is not None:
+            self._watch.close()
+
+
+_pool: Optional[ReadPool] = None
+
+
+def open_pool(db_path: str, size: int = POOL_SIZE) -> ReadPool:
+    """Create the shared pool; called once at application startup."""
+    global _pool
+    _pool = ReadPool(db_path, size)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def _outages_query(filters: OutageFilter, **kwargs) -> str:
+    return outage_store.outages_query(
+        companies=len(filters.companies), planned=filters.planned is not None,
+        min_customers=filters.min_customers is not None, fields=filters.fields,
+        after=filters.after is not None, limit=filters.limit is not None, **kwargs,
+    )
+
+
+def _outages_params(
+    params: tuple, detail: int, bbox: Optional[BBox], filters: OutageFilter = NO_FILTER, branches: int = 1
+) -> tuple:
+    params += tuple(filters.companies)
+    if detail:
+        params += (detail,)
+    # As-of queries filter each of their branches (hot rows, intervals, partitions) the same way
+    params += outage_store.filter_params(bbox, filters.planned, filters.min_customers, filters.after) * branches
+    if filters.limit is not None:
+        params += (filters.limit,)
+    return params
+
+
+def _outage_rows(
+    conn: sqlite3.Connection, db_path: str, timestamp: Optional[str], detail: int, bbox: Optional[BBox],
+    filters: OutageFilter,
+) -> Iterator[tuple]:
+    """Rows of the latest outages, or of those as of `timestamp`, in SNAPSHOT_OUTAGES_COLUMNS order."""
+    if not timestamp:
+        query = _outages_query(filters, detail=bool(detail), bbox=bbox is not None)
+        yield from conn.execute(query, _outages_params((), detail, bbox, filters))
+        return
+    months = [month for (month,) in conn.execute(outage_store.AS_OF_PARTITIONS_QUERY, (timestamp,))]
+    # Only the archive partitions holding the as-of snapshots are attached, and only for this query
+    partitions = archive.attach_partitions(conn, db_path, months)
+    try:
+        query = _outages_query(filters, as_of=True, detail=bool(detail), bbox=bbox is not None, partitions=partitions)
+        params = _outages_params((timestamp,), detail, bbox, filters, 2 + len(partitions))
+        yield from conn.execute(query, params)
+    finally:
+        archive.detach_partitions(conn, partitions)
+
+
+def _outages(
+    conn: sqlite3.Connection, db_path: str, timestamp: Optional[str], detail: int, bbox: Optional[BBox],
+    filters: OutageFilter, encoded: bool,
+) -> Iterator[Outage]:
+    for row in _outage_rows(conn, db_path, timestamp, detail, bbox, filters):
+        yield outage_store.row_to_outage(row, encoded, filters.fields)
+
+
+def _select_outages(conn: sqlite3.Connection, *args) -> list[Outage]:
+    return list(_outages(conn, *args))
+
+
+async def latest_outages(
+    bbox: Optional[BBox] = None, detail: int = 0, encoded: bool = False, filters: OutageFilter = NO_FILTER
+) -> list[Outage]:
+    """
+    The latest snapshot of every company, optionally limited to outages intersecting `bbox`
+    and with polygons at a simplified level of detail. With `encoded`, polygons are left
+    as their stored encoded polylines. `filters` narrows and projects the rows.
+    """
+    return await _pool.run(_select_outages, _pool.db_path, None, detail, bbox, filters, encoded)
+
+
+async def outages_as_of(
+    timestamp: str, bbox: Optional[BBox] = None, detail: int = 0, encoded: bool = False,
+    filters: OutageFilter = NO_FILTER,
+) -> list[Outage]:
+    """For every company, the latest snapshot taken at or before `timestamp`."""
+    return await _pool.run(_select_outages, _pool.db_path, timestamp, detail, bbox, filters, encoded)
+
+
+async def iter_outages(
+    timestamp: Optional[str] = None, bbox: Optional[BBox] = None, detail: int = 0, encoded: bool = False,
+    filters: OutageFilter = NO_FILTER,
+) -> AsyncIterator[list[Outage]]:
+    """
+    The same outages as outages_as_of (with a timestamp) or latest_outages, ordered by
+    company and row key and yielded a page of STREAM_PAGE_SIZE at a time. Each page is its
+    own keyset query, so no connection or read transaction stays open while a client reads.
+    """
+    filters = filters._replace(limit=STREAM_PAGE_SIZE)
+    while True:
+        outages, cursor = await _pool.run_stream_page(
+            _select_page, _pool.db_path, timestamp, detail, bbox, filters, encoded
+        )
+        if outages:
+            yield outages
+        if cursor is None:
+            return
+        filters = filters._replace(after=cursor)
+
+
+def _select_page(
+    conn: sqlite3.Connection, db_path: str, timestamp: Optional[str], detail: int, bbox: Optional[BBox],
+    filters: OutageFilter, encoded: bool,
+) -> Tuple[list[Outage], Optional[Cursor]]:
+    rows = list(_outage_rows(conn, db_path, timestamp, detail, bbox, filters))
+    # A full page may be followed by more; the next one starts after its last row
+    cursor = (rows[-1][11], rows[-1][16]) if rows and len(rows) == filters.limit else None
+    return [outage_store.row_to_outage(row, encoded, filters.fields) for row in rows], cursor
+
+
+async def outages_page(
+    timestamp: Optional[str], bbox: Optional[BBox], detail: int, encoded: bool, filters: OutageFilter
+) -> Tuple[list[Outage], Optional[Cursor]]:
+    """
+    One page of up to filters.limit outages of latest_outages or outages_as_of, ordered by
+    company and row key, starting after filters.after. Also returns the cursor of the next
+    page, or None once the outages are exhausted.
+    """
+    return await _pool.run(_select_page, _pool.db_path, timestamp, detail, bbox, filters, encoded)
+
+
+async def data_version() -> int:
+    """Cheap commit counter; a change means some scraper wrote since the last call."""
+    return await _pool.data_version()
+
+
+def _select_watermarks(conn: sqlite3.Connection) -> dict[str, str]:
+    return dict(conn.execute(outage_store.LATEST_SNAPSHOTS_QUERY).fetchall())
+
+
+async def snapshot_watermarks() -> dict[str, str]:
+    """The apiCallTimestamp of every company's latest snapshot."""
+    return await _pool.run(_select_watermarks)
+
+
+def _select_company_snapshot(
+    conn: sqlite3.Connection, company: str, levels: Tuple[int, ...]
+) -> Tuple[Optional[str], dict[int, list[Outage]]]:
+    # One read transaction, so the watermark and every level come from the same commit
+    conn.execute("BEGIN")
+    try:
+        timestamp = conn.execute(outage_store.COMPANY_WATERMARK_QUERY, (company,)).fetchone()[0]
+        outages = {}
+        for level in (0,) + levels:
+            query = outage_store.outages_query(company=True, detail=bool(level))
+            rows = conn.execute(query, _outages_params((company,), level, None))
+            outages[level] = [outage_store.row_to_outage(row) for row in rows]
+    finally:
+        conn.rollback()
+    return timestamp, outages
+
+
+async def company_snapshot(
+    company: str, levels: Tuple[int, ...] = ()
+) -> Tuple[Optional[str], dict[int, list[Outage]]]:
+    """
+    One company's latest snapshot: its apiCallTimestamp (None when it has none) and
+    {level: outages} at full detail (level 0) and at each of the simplified `levels`.
+    """
+    return await _pool.run(_select_company_snapshot, company, levels)
+
+
+def _select_rows(conn: sqlite3.Connection, query: str, params: tuple) -> list[tuple]:
+    return conn.execute(query, params).fetchall()
+
+
+async def outage_changes(after: int, limit: int) -> list[tuple]:
+    """
+    Changelog entries with an offset greater than `after`, oldest first, as
+    (offset, company, outage id, change, apiCallTimestamp, outage JSON or None) rows.
+    """
+    return await _pool.run(_select_rows, outage_store.OUTAGE_CHANGES_QUERY, (after, limit))
+
+
+async def rollups(scope: str, name: str, resolution: int, start: int, end: int) -> list[tuple]:
+    """
+    Rollup buckets of one company, province or the country between two Unix times, as
+    (bucket start, customers out, outage count, largest outage) rows, oldest first.
+    """
+    return await _pool.run(_select_rows, outage_store.ROLLUPS_QUERY, (scope, name, resolution, start, end))
+
+
+async def export_outages(sink: str, start: str, end: str, companies: Optional[list[str]], file_format: str) -> int:
+    """
+    Write the snapshots taken in [start, end) to the file `sink` with export.write_export and
+    return the number of rows. An export can read for a long time, so it holds one of the
+    STREAM_POOL_SIZE connections shared with streamed responses.
+    """
+    return await _pool.run_stream_page(export.write_export, _pool.db_path, sink, start, end, companies, file_format)
@@ -0,0 +1,212 @@
+"""
+Columnar export of the outage history for analytics.
+
+Streams the snapshot rows of a time range (and optionally a set of companies) from
+a read-only connection (a pooled one, see db.export_outages, when the API serves it)
+into a Parquet or Arrow IPC file, one row group per chunk of CHUNK_SIZE rows, so
+memory stays bounded however long the range is. company, cause and
+crewStatusDescription are dictionary-encoded, sharing one growing dictionary across
+chunks. Snapshots archived to monthly partitions are read from them, and
+snapshots stored in interval mode are rebuilt from the outage_intervals versions live
+at their timestamp, so every snapshot in the range is exported the same way.
+
+    python3 export.py --from 2024-12-01 --to 2025-01-01 [--company "BC Hydro" ...]
+        [--format parquet|arrow] [--db DB_FILE] OUTPUT
+
+pyarrow is optional; without it the export is unavailable.
+"""
+import argparse
+import sqlite3
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # the export is the only feature that needs pyarrow
+    pa = None
+
+import archive
+import geometry
+import outage_store
+
+CHUNK_SIZE = 50000  # Rows per row group / record batch
+FORMATS = ("parquet", "arrow")
+MEDIA_TYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.file"}
+
+DICTIONARY_COLUMNS = ("company", "cause", "crewStatusDescription")
+
+
+def export_schema():
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.string()),
+        ("company", dictionary),
+        ("apiCallTimestamp", pa.timestamp("us", tz="UTC")),
+        ("municipality", pa.string()),
+        ("area", pa.string()),
+        ("cause", dictionary),
+        ("numCustomersOut", pa.int64()),
+        ("crewStatusDescription", dictionary),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("dateOff", pa.string()),
+        ("crewEta", pa.string()),
+        ("planned", pa.bool_()),
+        ("geometry", pa.string()),  # encoded polyline of (lat, lon) points
+        ("polygonLayout", pa.int8()),
+    ])
+
+
+def _geometry(polygon, encoded, layout):
+    if encoded or not polygon:
+        return encoded, layout
+    # Rows whose JSON polygon couldn't be moved to the canonical columns
+    try:
+        return geometry.encode_polygon(polygon)
+    except (ValueError, TypeError, IndexError):
+        return None, None
+
+
+class _Dictionary:
+    """A dictionary that only grows, so every chunk's dictionary extends the previous one."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def encode(self, values):
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            position = self.index.get(value)
+            if position is None:
+                position = self.index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(position)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(self.values, pa.string()))
+
+
+def _snapshot_rows(conn, db_file, start, end, companies):
+    """
+    Yield STORED_COLUMNS rows of the snapshots in [start, end), partition by partition.
+    The manifest is read with a cursor per partition rather than loaded up front.
+    """
+    where = "apiCallTimestamp >= ? AND apiCallTimestamp < ?"
+    params = [start, end]
+    if companies:
+        where += f" AND company IN ({', '.join('?' for _ in companies)})"
+        params.extend(companies)
+    months = [
+        month for (month,) in conn.execute(f"SELECT DISTINCT partitionMonth FROM snapshots WHERE {where}", params)
+    ]
+
+    columns = ", ".join(outage_store.STORED_COLUMNS)
+    # An interval version stands for every snapshot between its firstSeen and lastSeen
+    interval_columns = ", ".join(
+        "? AS apiCallTimestamp" if column == "apiCallTimestamp" else column for column in outage_store.STORED_COLUMNS
+    )
+    for month in sorted(months, key=lambda month: month or "~"):
+        attached = archive.attach_partitions(conn, db_file, [month]) if month else {}
+        table = f"{attached[month]}.outages" if month else "outages"
+        manifest = conn.cursor()
+        try:
+            manifest.execute(
+                f"SELECT company, apiCallTimestamp, intervals FROM snapshots WHERE {where} AND partitionMonth IS ?"
+                " ORDER BY apiCallTimestamp, company",
+                params + [month],
+            )
+            for company, api_call_timestamp, intervals in manifest:
+                if intervals:
+                    yield from conn.execute(
+                        f"SELECT {interval_columns} FROM outage_intervals"
+                        " WHERE company = ? AND lastSeen >= ? AND firstSeen <= ? ORDER BY rowid",
+                        (api_call_timestamp, company, api_call_timestamp, api_call_timestamp),
+                    )
+                else:
+                    yield from conn.execute(
+                        f"SELECT {columns} FROM {table} WHERE company = ? AND apiCallTimestamp = ?",
+                        (company, api_call_timestamp),
+                    )
+        finally:
+            manifest.close()
+            archive.detach_partitions(conn, attached)
+
+
+def _record_batch(rows, schema, dictionaries):
+    encoded = [_geometry(row[10], row[14], row[15]) for row in rows]
+    columns = {
+        "id": pa.array([None if row[0] is None else str(row[0]) for row in rows], pa.string()),
+        "company": dictionaries["company"].encode([row[11] for row in rows]),
+        "apiCallTimestamp": pa.array([outage_store.parse_timestamp(row[13]) for row in rows], pa.timestamp("us", tz="UTC")),
+        "municipality": pa.array([row[1] for row in rows], pa.string()),
+        "area": pa.array([row[2] for row in rows], pa.string()),
+        "cause": dictionaries["cause"].encode([row[3] for row in rows]),
+        "numCustomersOut": pa.array([outage_store.customer_count(row[4], None) for row in rows], pa.int64()),
+        "crewStatusDescription": dictionaries["crewStatusDescription"].encode([row[5] for row in rows]),
+        "latitude": pa.array([row[6] for row in rows], pa.float64()),
+        "longitude": pa.array([row[7] for row in rows], pa.float64()),
+        "dateOff": pa.array([row[8] for row in rows], pa.string()),
+        "crewEta": pa.array([row[9] for row in rows], pa.string()),
+        "planned": pa.array([None if row[12] is None else bool(row[12]) for row in rows], pa.bool_()),
+        "geometry": pa.array([polyline for polyline, _ in encoded], pa.string()),
+        "polygonLayout": pa.array([layout for _, layout in encoded], pa.int8()),
+    }
+    return pa.record_batch([columns[field.name] for field in schema], schema=schema)
+
+
+def write_export(conn, db_file, sink, start, end, companies=None, file_format="parquet"):
+    """
+    Write the snapshot rows taken in [start, end) to `sink` (a path or binary file
+    object) as Parquet or an Arrow IPC file, reading them through `conn`, a connection
+    to db_file. Returns the number of rows written.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    if file_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    schema = export_schema()
+    dictionaries = {name: _Dictionary() for name in DICTIONARY_COLUMNS}
+    if file_format == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+        writer = pa.ipc.new_file(sink, schema, options=options)
+    written = 0
+    try:
+        chunk = []
+        for row in _snapshot_rows(conn, db_file, start, end, companies):
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                writer.write_batch(_record_batch(chunk, schema, dictionaries))
+                written += len(chunk)
+                chunk = []
+        if chunk or not written:
+            writer.write_batch(_record_batch(chunk, schema, dictionaries))
+            written += len(chunk)
+    finally:
+        writer.close()
+    return written
+
+
+def export_outages(db_file, sink, start, end, companies=None, file_format="parquet"):
+    """write_export on a read-only connection of its own, for the command line."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        return write_export(conn, db_file, sink, start, end, companies, file_format)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export outage history to Parquet or Arrow IPC.")
+    parser.add_argument("output")
+    parser.add_argument("--from", dest="start", required=True, help="ISO timestamp, inclusive")
+    parser.add_argument("--to", dest="end", required=True, help="ISO timestamp, exclusive")
+    parser.add_argument("--company", action="append", help="Repeat to export several companies")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--db", default=outage_store.DB_FILE)
+    args = parser.parse_args()
+    count = export_outages(args.db, args.output, args.start, args.end, args.company, args.format)
+    print(f"Exported {count} rows to {args.output}")
@@ -0,0 +1,238 @@
+"""
+Geometry helpers shared by the scrapers' write path and the API.
+
+Scrapers store polygons in whatever shape their source uses: flat
+[lon, lat, lon, lat, ...] lists (NB Power, Hydro Ottawa, BC Hydro), [[lat, lon], ...]
+pairs (Quebec Hydro, FortisBC, Hydro One), or nothing at all for point-only sources.
+Every outage we cover is in Canada, where longitudes are negative and latitudes
+positive, which is enough to tell the axis order of any coordinate pair.
+
+In SQLite, polygons are stored in one canonical form: a Google encoded polyline of
+(lat, lon) points at 5 decimal places (about a metre), plus a small layout code that
+records the shape the scraper gave, so the API can hand back the same shape.
+"""
+from functools import lru_cache
+import itertools
+import json
+
+
+def lon_lat(a, b):
+    """Return the pair (a, b) as (lon, lat), whichever order it was given in."""
+    if a < 0 <= b:
+        return a, b
+    return b, a
+
+
+def load_polygon(polygon):
+    """Decode a polygon stored as JSON text; lists pass through unchanged."""
+    if isinstance(polygon, (str, bytes)):
+        polygon = json.loads(polygon) if polygon else []
+    if isinstance(polygon, str):
+        # Some rows hold a JSON string that was encoded twice (Manitoba Hydro's '"[]"'). The
+        # API used to return those as the string "[]"; they now come back as an empty list.
+        polygon = json.loads(polygon) if polygon else []
+    return polygon
+
+
+def polygon_points(polygon):
+    """Normalize any stored polygon shape into a list of (lon, lat) tuples."""
+    polygon = load_polygon(polygon)
+    if not polygon:
+        return []
+    if isinstance(polygon[0], (int, float)):
+        return [lon_lat(polygon[i], polygon[i + 1]) for i in range(0, len(polygon) - 1, 2)]
+    return [lon_lat(point[0], point[1]) for point in polygon if len(point) >= 2]
+
+
+# Layout codes stored next to an encoded polygon: the shape and axis order it came in
+LAYOUT_FLAT_LON_LAT = 0
+LAYOUT_FLAT_LAT_LON = 1
+LAYOUT_PAIRS_LON_LAT = 2
+LAYOUT_PAIRS_LAT_LON = 3
+
+POLYLINE_PRECISION = 1e5
+DECODED_POLYGON_CACHE_SIZE = 4096  # Decoded polygons kept for the rows served again on every request
+
+
+def _encode_polyline_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points):
+    """Encode (lat, lon) points as a Google encoded polyline."""
+    out = []
+    previous_lat = previous_lon = 0
+    for lat, lon in points:
+        lat = int(round(lat * POLYLINE_PRECISION))
+        lon = int(round(lon * POLYLINE_PRECISION))
+        _encode_polyline_value(lat - previous_lat, out)
+        _encode_polyline_value(lon - previous_lon, out)
+        previous_lat, previous_lon = lat, lon
+    return "".join(out)
+
+
+def decode_polyline(encoded):
+    """Decode a Google encoded polyline into a list of (lat, lon) tuples."""
+    deltas = []
+    result = shift = 0
+    for byte in encoded.encode("ascii"):
+        byte -= 63
+        result |= (byte & 0x1F) << shift
+        if byte < 0x20:
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+        else:
+            shift += 5
+    lats = itertools.accumulate(deltas[0::2])
+    lons = itertools.accumulate(deltas[1::2])
+    return [(lat / POLYLINE_PRECISION, lon / POLYLINE_PRECISION) for lat, lon in zip(lats, lons)]
+
+
+def encode_polygon(polygon):
+    """
+    Canonical storage form of a polygon in any stored shape: (encoded polyline, layout
+    code), or (None, None) when it has no points.
+    """
+    polygon = load_polygon(polygon)
+    points = polygon_points(polygon)
+    if not points:
+        return None, None
+    if isinstance(polygon[0], (int, float)):
+        layout = LAYOUT_FLAT_LON_LAT if polygon[0] < 0 else LAYOUT_FLAT_LAT_LON
+    else:
+        layout = LAYOUT_PAIRS_LON_LAT if polygon[0][0] < 0 else LAYOUT_PAIRS_LAT_LON
+    return encode_polyline([(lat, lon) for lon, lat in points]), layout
+
+
+@lru_cache(maxsize=DECODED_POLYGON_CACHE_SIZE)
+def decode_polygon(encoded, layout):
+    """
+    Rebuild a polygon from its encoded polyline in the shape given by its layout code.
+    Results are cached, as the latest snapshot's polygons are decoded for every /outages
+    request; callers share the returned list and must not modify it.
+    """
+    if not encoded:
+        return []
+    points = decode_polyline(encoded)
+    if layout == LAYOUT_FLAT_LON_LAT:
+        return [value for lat, lon in points for value in (lon, lat)]
+    if layout == LAYOUT_FLAT_LAT_LON:
+        return [value for point in points for value in point]
+    if layout == LAYOUT_PAIRS_LON_LAT:
+        return [[lon, lat] for lat, lon in points]
+    return [[lat, lon] for lat, lon in points]
+
+
+def stored_polygon(polygon, encoded, layout):
+    """
+    The polygon of an outages row: decoded from its canonical columns, or parsed from
+    the JSON text in the polygon column for rows written before those existed.
+    """
+    if encoded:
+        return decode_polygon(encoded, layout)
+    if polygon:
+        return load_polygon(polygon)
+    return []
+
+
+def outage_extent(polygon, latitude, longitude):
+    """
+    Bounding box (min_lon, min_lat, max_lon, max_lat) of an outage: its polygon's
+    bounds, or its point for point-only sources. None when it has no usable location.
+    """
+    points = polygon_points(polygon)
+    if points:
+        lons = [lon for lon, _ in points]
+        lats = [lat for _, lat in points]
+        return min(lons), min(lats), max(lons), max(lats)
+    if not latitude or not longitude:
+        return None
+    lon, lat = lon_lat(longitude, latitude)
+    return lon, lat, lon, lat
+
+
+def detail_for_zoom(zoom):
+    """Polygon level of detail (0 = original) suited to a map zoom level."""
+    if zoom >= 12:
+        return 0
+    if zoom >= 9:
+        return 1
+    if zoom >= 6:
+        return 2
+    return 3
+
+
+def parse_bbox(value):
+    """Parse a "minLon,minLat,maxLon,maxLat" query parameter; raises ValueError when malformed."""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed its maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def extents_intersect(extent, bbox):
+    """True when two (min_lon, min_lat, max_lon, max_lat) boxes overlap."""
+    return (
+        extent[0] <= bbox[2] and extent[2] >= bbox[0]
+        and extent[1] <= bbox[3] and extent[3] >= bbox[1]
+    )
+
+
+def _point_segment_distance(point, start, end):
+    (px, py), (ax, ay), (bx, by) = point, start, end
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return ((px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2) ** 0.5
+
+
+def douglas_peucker(points, tolerance):
+    """Simplify a list of (x, y) points, keeping both endpoints (iterative Douglas-Peucker)."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, max_distance = None, tolerance
+        for i in range(first + 1, last):
+            distance = _point_segment_distance(points[i], points[first], points[last])
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_polygon(polygon, tolerance):
+    """
+    Simplify a stored polygon with Douglas-Peucker and return it in the same layout it
+    came in (flat list or pairs, same axis order). Returns None when simplification
+    would not drop any point or would leave fewer than three.
+    """
+    polygon = load_polygon(polygon)
+    points = polygon_points(polygon)
+    if len(points) < 4:
+        return None
+    simplified = douglas_peucker(points, tolerance)
+    if len(simplified) < 3 or len(simplified) == len(points):
+        return None
+    if isinstance(polygon[0], (int, float)):
+        flat = []
+        for lon, lat in simplified:
+            flat.extend((lon, lat) if polygon[0] < 0 else (lat, lon))
+        return flat
+    if polygon[0][0] < 0:
+        return [[lon, lat] for lon, lat in simplified]
+    return [[lat, lon] for lon, lat in simplified]
@@ -1,9 +1,29 @@
-from fastapi import FastAPI, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-import sqlite3
+from fastapi import FastAPI, BackgroundTasks, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 import json
 import asyncio
+import base64
+import csv
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import io
+import mmap
 import os
+import tempfile
+import time
+
+import broadcast
+import clusters
+import db
+import export
+import geometry
+import metrics
+import outage_store
+import static_assets
+import summary
+import vector_tiles
+import weather_alerts
 
 app = FastAPI()
 
@@ -11,86 +31,466 @@ app = FastAPI()
 INDEX_HTML = "/root/ohub/ohub-fe/index.html"
 CSS_FILE = "/root/ohub/ohub-fe/styles.css"
 JS_FILE = "/root/ohub/ohub-fe/script.js"
+FEEDBACK_HTML = "/root/ohub/ohub-fe/feedback.html"
 DB_PATH = "/root/ohub/ohub-db/ohub-db/outages_db"
 CACHE_FILE_PATH = "/root/ohub/ohub-be/outages_cache.json"
+ALERTS_FILE = "/root/ohub/ohub-be/weather_api/matched_weather_alerts_with_polygons.json"
+CACHE_FILE_GZIP = False  # Also write a gzip-compressed copy of the cache file alongside it
+REFRESH_CHECK_INTERVAL = 5  # Seconds between checks for new scraper commits
+STATIC_CHECK_INTERVAL = 2  # Seconds between checks for changed frontend files
+MAX_PAGE_SIZE = 10000  # Largest /outages page
+DEFAULT_PAGE_SIZE = 1000  # /outages page size when a cursor is given without a limit
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event-loop lag measurements
+# Compression of the outages payloads, rebuilt for every level of detail on each refresh. Far cheaper than
+# the static assets' maximum levels (gzip 9 takes ~4x, brotli 9 ~3x as long) for bodies a few percent larger
+PAYLOAD_GZIP_LEVEL = 6
+PAYLOAD_BROTLI_QUALITY = 5
+
+# Global cache for preloaded outages. "companies" and "watermarks" hold each company's rows and
+# snapshot timestamp, "data" is their concatenation and "payloads" its encoded body per content-encoding
+# "stale" marks data warm-started from the cache file that hasn't been checked against SQLite yet
+outages_cache = {
+    "data": [], "companies": {}, "watermarks": {}, "last_updated": None, "payloads": {}, "stale": False,
+    "extents": [], "clusters": {}, "tiles": None,
+    # Per level of detail: {level: {company: rows}}, the concatenated rows and their encoded payloads
+    "simplified": {}, "detail_data": {}, "detail_payloads": {},
+    # Per-company headline totals and the encoded /summary body built from them
+    "totals": {}, "summary": None,
+    # AlertIndex of the weather alerts file, the file's stat it was built from and {alert id: [outage]}
+    "alerts": None, "alerts_stat": None, "alert_outages": {},
+}
+
+# Connected /outages/stream clients
+updates = broadcast.Broadcaster()
+
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+REQUEST_SECONDS = metrics.Histogram(
+    "ohub_http_request_duration_seconds", "Time until the response headers are sent, per route.",
+    ["route", "method", "status"],
+)
+RESPONSE_SECONDS = metrics.Histogram(
+    "ohub_http_response_duration_seconds", "Time until the last response body chunk is sent, per route.",
+    ["route", "method", "status"],
+)
+REFRESH_SECONDS = metrics.Histogram("ohub_refresh_duration_seconds", "Duration of cache refreshes that reloaded data.")
+REFRESH_ROWS = metrics.Histogram(
+    "ohub_refresh_rows", "Outage rows reloaded from SQLite per refresh.", buckets=SIZE_BUCKETS
+)
+REFRESH_BYTES = metrics.Histogram(
+    "ohub_refresh_bytes", "Bytes of payloads encoded per refresh, over every level and encoding.", buckets=SIZE_BUCKETS
+)
+REFRESH_COMPANY_ROWS = metrics.Counter(
+    "ohub_refresh_company_rows_total", "Outage rows reloaded from SQLite, per company.", ["company"]
+)
+LOOP_LAG_SECONDS = metrics.Histogram(
+    "ohub_event_loop_lag_seconds", "How late the event loop woke a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+def _payload_sizes():
+    sizes = {("outages", encoding): len(body) for encoding, body in outages_cache["payloads"].items()}
+    for level, payloads in outages_cache["detail_payloads"].items():
+        sizes.update({(f"outages_detail_{level}", encoding): len(body) for encoding, body in payloads.items()})
+    if outages_cache["summary"] is not None:
+        sizes[("summary", "identity")] = len(outages_cache["summary"])
+    return sizes
+
+
+def _cache_ages():
+    now = time.time()
+    ages = {}
+    for company, api_call_timestamp in outages_cache["watermarks"].items():
+        try:
+            ages[(company,)] = now - outage_store.timestamp_epoch(api_call_timestamp)
+        except (ValueError, TypeError):
+            continue
+    return ages
+
+
+def _refresh_age():
+    if outages_cache["last_updated"] is None:
+        return {}
+    return {(): asyncio.get_event_loop().time() - outages_cache["last_updated"]}
+
+
+metrics.Gauge(
+    "ohub_payload_bytes", "Size of each cached, serialized payload.", ["payload", "encoding"], collect=_payload_sizes
+)
+metrics.Gauge(
+    "ohub_cache_outages", "Outages in the cache, per company.", ["company"],
+    collect=lambda: {(company,): len(rows) for company, rows in outages_cache["companies"].items()},
+)
+metrics.Gauge(
+    "ohub_cache_age_seconds", "Age of the snapshot cached for each company.", ["company"], collect=_cache_ages
+)
+metrics.Gauge(
+    "ohub_cache_refresh_age_seconds", "Time since the cache was last reloaded from SQLite.", collect=_refresh_age
+)
+metrics.Gauge(
+    "ohub_cache_stale", "1 while the cache is warm-started from its file and not yet checked against SQLite.",
+    collect=lambda: {(): int(outages_cache["stale"])},
+)
+
+# Frontend files, served from memory
+static_files = static_assets.AssetStore({
+    "index.html": INDEX_HTML, "styles.css": CSS_FILE, "script.js": JS_FILE, "feedback.html": FEEDBACK_HTML,
+})
+
+# Hash of the outages body last written to CACHE_FILE_PATH
+saved_cache_digest = None
+
+def build_payloads(data):
+    """
+    Serialize the outages once and precompress the body for each supported encoding.
+    """
+    body = outage_store.payload_json(data).encode("utf-8")
+    return static_assets.compressed_payloads(body, PAYLOAD_GZIP_LEVEL, PAYLOAD_BROTLI_QUALITY)
+
+def build_extents(data):
+    """
+    Bounding box of every cached outage, in the same order as the data, for bbox filtering.
+    """
+    extents = []
+    for outage in data:
+        try:
+            extents.append(geometry.outage_extent(outage["polygon"], outage["latitude"], outage["longitude"]))
+        except (ValueError, TypeError, IndexError):
+            extents.append(None)
+    return extents
+
+def negotiate_encoding(accept_encoding, payloads):
+    """
+    Pick the best available encoding for an Accept-Encoding header, preferring br over gzip.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    for coding in ("br", "gzip"):
+        if coding in payloads and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
 
-# Global cache for preloaded outages
-outages_cache = {"data": [], "last_updated": None}
+def write_file_atomically(path, content):
+    """
+    Write bytes to a temp file in the same directory and rename it over `path`,
+    so readers only ever see the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)  # Ensure the directory exists
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; keep the file readable like before
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-def save_cache_to_file(cache_data):
+def save_cache_to_file(body, last_updated):
     """
-    Save the cache data to a file in JSON format.
+    Save the cache to a file as compact JSON, reusing the already-encoded outages body.
+    Meant to run on a worker thread; skipped when the outages haven't changed since the last save.
     """
+    global saved_cache_digest
     try:
-        os.makedirs(os.path.dirname(CACHE_FILE_PATH), exist_ok=True)  # Ensure the directory exists
-        with open(CACHE_FILE_PATH, "w") as cache_file:
-            json.dump(cache_data, cache_file, indent=4)
+        digest = hashlib.sha256(body).digest()
+        if digest == saved_cache_digest:
+            return
+        content = b'{"data":' + body + b',"last_updated":' + json.dumps(last_updated).encode("utf-8") + b"}"
+        write_file_atomically(CACHE_FILE_PATH, content)
+        if CACHE_FILE_GZIP:
+            write_file_atomically(CACHE_FILE_PATH + ".gz", gzip.compress(content))
+        saved_cache_digest = digest
         print(f"Cache saved to file: {CACHE_FILE_PATH}")
     except Exception as e:
         print(f"Error saving cache to file: {e}")
 
-def fetch_outages_from_db():
-    """
-    Fetch the latest outages for each company from the database.
-    """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        query = """
-            SELECT id, municipality, area, cause, numCustomersOut, 
-                   crewStatusDescription, latitude, longitude, 
-                   dateOff, crewEta, polygon, company, planned,
-                   apiCallTimestamp
-            FROM outages
-            WHERE apiCallTimestamp IN (
-                SELECT MAX(apiCallTimestamp)
-                FROM outages
-                GROUP BY company
-            )
-        """
-        rows = cursor.execute(query).fetchall()
-        outages = [
-            {
-                "id": row[0],
-                "municipality": row[1],
-                "area": row[2],
-                "cause": row[3],
-                "num_customers": row[4],
-                "crew_status": row[5],
-                "latitude": row[6],
-                "longitude": row[7],
-                "date_off": row[8],
-                "crew_eta": row[9],
-                "polygon": json.loads(row[10]) if row[10] else [],
-                "power_company": row[11],
-                "planned": row[12],
-                "time_stamp": row[13],
-            }
-            for row in rows
-        ]
-        return outages
+def load_cache_from_file():
+    """
+    Warm the cache from the last persisted snapshot so the API can serve as soon as it boots.
+    The file is memory-mapped and, when it was written by save_cache_to_file, its outages body
+    is served as-is without re-encoding. The data stays marked stale until the first refresh.
+    """
+    global saved_cache_digest
+    prefix = b'{"data":'
+    try:
+        with open(CACHE_FILE_PATH, "rb") as cache_file, \
+                mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            suffix_start = mapped.rfind(b',"last_updated":')
+            if mapped[:len(prefix)] == prefix and suffix_start != -1:
+                body = mapped[len(prefix):suffix_start]
+                data = json.loads(body)
+            else:
+                # Older, indented cache files: parse and re-encode once
+                data = json.loads(mapped[:]).get("data", [])
+                body = outage_store.payload_json(data).encode("utf-8")
+    except FileNotFoundError:
+        return False
     except Exception as e:
-        print(f"Error fetching outages from database: {e}")
+        print(f"Error loading cache from file: {e}")
+        return False
+
+    companies = group_by_company(data)
+    outages_cache["companies"] = companies
+    # Rows of one company share their snapshot's timestamp, which is exactly the refresh watermark
+    outages_cache["watermarks"] = {company: rows[0]["time_stamp"] for company, rows in companies.items()}
+    outages_cache["data"] = data
+    outages_cache["extents"] = build_extents(data)
+    outages_cache["clusters"] = clusters.build_clusters(data, outages_cache["extents"])
+    outages_cache["tiles"] = vector_tiles.TileSet(data, outages_cache["extents"])
+    outages_cache["totals"] = {company: summary.company_totals(rows) for company, rows in companies.items()}
+    outages_cache["summary"] = summary.build_summary(outages_cache["totals"], outages_cache["watermarks"])
+    # Only the identity body for now; the first refresh builds the compressed variants
+    outages_cache["payloads"] = {"identity": body}
+    outages_cache["stale"] = True
+    saved_cache_digest = hashlib.sha256(body).digest()
+    print(f"Cache warm-started from file: {CACHE_FILE_PATH} ({len(data)} outages)")
+    return True
+
+
+def group_by_company(data, names=()):
+    """{company: rows} of concatenated outages, with an empty list for each of `names` that has none."""
+    companies = {name: [] for name in names}
+    for outage in data:
+        companies.setdefault(outage["power_company"], []).append(outage)
+    return companies
+
+
+async def refresh_changed_companies():
+    """
+    Reload only the companies whose latest snapshot changed since the last refresh and
+    merge them into the cache. Returns the companies that were reloaded or dropped.
+    """
+    watermarks = await db.snapshot_watermarks()
+    companies = dict(outages_cache["companies"])
+    totals = dict(outages_cache["totals"])
+    simplified = {level: dict(outages_cache["simplified"].get(level, {})) for level in outage_store.LOD_TOLERANCES}
+    if outages_cache["stale"]:
+        # A warm-started cache has no simplified polygons yet, so reload every company once
+        changed = list(watermarks)
+    else:
+        changed = [company for company, ts in watermarks.items() if outages_cache["watermarks"].get(company) != ts]
+    removed = [company for company in companies if company not in watermarks]
+    if not changed and not removed:
         return []
-    finally:
-        conn.close()
+
+    started = time.perf_counter()
+    for company in changed:
+        # Record the snapshot actually loaded, which is newer if a scraper committed meanwhile
+        watermarks[company], levels = await db.company_snapshot(company, tuple(simplified))
+        companies[company] = levels[0]
+        REFRESH_COMPANY_ROWS.inc(len(companies[company]), company=company)
+        for level in simplified:
+            simplified[level][company] = levels[level]
+        totals[company] = summary.company_totals(companies[company])
+    for company in removed:
+        del companies[company]
+        totals.pop(company, None)
+        for level in simplified:
+            simplified[level].pop(company, None)
+
+    data = [outage for company in sorted(companies) for outage in companies[company]]
+    detail_data = {
+        level: [outage for company in sorted(by_company) for outage in by_company[company]]
+        for level, by_company in simplified.items()
+    }
+    extents = await asyncio.to_thread(build_extents, data)
+    # Before encoding, so the payloads and the stream diff carry each outage's alert ids
+    data, detail_data, alert_outages = await asyncio.to_thread(
+        weather_alerts.join_outages, outages_cache["alerts"], data, extents, detail_data
+    )
+    companies = group_by_company(data, companies)
+    # Encode and compress off the event loop; requests keep getting the old payloads meanwhile
+    payloads = await asyncio.to_thread(build_payloads, data)
+    detail_payloads = {level: await asyncio.to_thread(build_payloads, rows) for level, rows in detail_data.items()}
+    outage_clusters = await asyncio.to_thread(clusters.build_clusters, data, extents)
+    # A new TileSet per snapshot also drops every tile encoded for the previous one
+    tiles = await asyncio.to_thread(vector_tiles.TileSet, data, extents)
+
+    outages_summary = summary.build_summary(totals, watermarks)
+
+    upserts, removed_outages = [], []
+    for company in changed + removed:
+        company_upserts, removed_ids = broadcast.diff_outages(
+            outages_cache["companies"].get(company, []), companies.get(company, [])
+        )
+        upserts.extend(company_upserts)
+        removed_outages.extend({"power_company": company, "id": outage_id} for outage_id in removed_ids)
+
+    # Nothing below can fail, so the watermarks only move once every part of the cache has
+    outages_cache["companies"] = companies
+    outages_cache["simplified"] = simplified
+    outages_cache["watermarks"] = watermarks
+    outages_cache["data"] = data
+    outages_cache["payloads"] = payloads
+    outages_cache["detail_data"] = detail_data
+    outages_cache["detail_payloads"] = detail_payloads
+    outages_cache["extents"] = extents
+    outages_cache["alert_outages"] = alert_outages
+    outages_cache["clusters"] = outage_clusters
+    outages_cache["tiles"] = tiles
+    outages_cache["totals"] = totals
+    outages_cache["summary"] = outages_summary
+    outages_cache["last_updated"] = asyncio.get_event_loop().time()
+    outages_cache["stale"] = False
+    REFRESH_SECONDS.observe(time.perf_counter() - started)
+    REFRESH_ROWS.observe(sum(len(companies[company]) for company in changed))
+    REFRESH_BYTES.observe(
+        sum(len(body) for body in payloads.values())
+        + sum(len(body) for level in detail_payloads.values() for body in level.values())
+    )
+    if upserts or removed_outages:
+        # Encoded once here; every connected stream gets the same bytes
+        updates.publish(upserts, removed_outages)
+    return changed + removed
+
+
+async def refresh_alerts():
+    """
+    Rebuild the alert index when the weather alerts file changed on disk or one of its
+    alerts expired, and rejoin the cached outages with it. Returns whether the cached
+    outages were re-encoded.
+    """
+    try:
+        stat = os.stat(ALERTS_FILE)
+        alerts_stat = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        alerts_stat = None
+    index = outages_cache["alerts"]
+    if alerts_stat == outages_cache["alerts_stat"] and not (index and index.expired()):
+        return False
+    outages_cache["alerts_stat"] = alerts_stat
+    outages_cache["alerts"] = await asyncio.to_thread(weather_alerts.load_alerts, ALERTS_FILE) if alerts_stat else None
+    if outages_cache["stale"] or not outages_cache["data"]:
+        # The next refresh joins the outages it loads
+        return False
+
+    data, detail_data, alert_outages = await asyncio.to_thread(
+        weather_alerts.join_outages, outages_cache["alerts"], outages_cache["data"], outages_cache["extents"],
+        outages_cache["detail_data"],
+    )
+    payloads = await asyncio.to_thread(build_payloads, data)
+    detail_payloads = {level: await asyncio.to_thread(build_payloads, rows) for level, rows in detail_data.items()}
+    outages_cache["companies"] = group_by_company(data, outages_cache["companies"])
+    outages_cache["data"] = data
+    outages_cache["payloads"] = payloads
+    outages_cache["detail_data"] = detail_data
+    outages_cache["detail_payloads"] = detail_payloads
+    outages_cache["alert_outages"] = alert_outages
+    return True
 
 
 async def update_outages_cache():
     """
-    Update the global outages cache periodically and save it to a file.
+    Keep the outages cache current and save it to a file whenever it changes.
+
+    SQLite's data_version is checked every few seconds; only when a scraper has
+    committed are the snapshot watermarks compared and the changed companies reloaded.
     """
+    try:
+        # Create the schema of a new database, or fail early on one that still needs migrate.py
+        await asyncio.to_thread(lambda: outage_store.connect(DB_PATH).close())
+    except Exception as e:
+        print(f"Error preparing the outages database: {e}")
+
+    seen_version = None
     while True:
         try:
-            outages_cache["data"] = fetch_outages_from_db()
-            outages_cache["last_updated"] = asyncio.get_event_loop().time()
-            print("Outages cache updated")
-            
-            # Save the cache to a file
-            save_cache_to_file(outages_cache)
+            rejoined = await refresh_alerts()
+            if rejoined:
+                print("Weather alerts rejoined with the cached outages")
+            version = await db.data_version()
+            changed = []
+            if version != seen_version:
+                changed = await refresh_changed_companies()
+                # Only once the refresh succeeded, so a failed one is retried on the next check. The
+                # version was read before refreshing, so a commit landing mid-refresh still triggers a pass.
+                seen_version = version
+                if changed:
+                    print(f"Outages cache updated for: {', '.join(changed)}")
+            if changed or rejoined:
+                # Save the cache to a file without blocking the event loop
+                await asyncio.to_thread(
+                    save_cache_to_file, outages_cache["payloads"]["identity"], outages_cache["last_updated"]
+                )
         except Exception as e:
             print(f"Error updating outages cache: {e}")
-        await asyncio.sleep(300)  # Refresh every 5 minutes
+        await asyncio.sleep(REFRESH_CHECK_INTERVAL)
+
+
+async def watch_static_assets():
+    """
+    Reload frontend files that changed on disk, so a deploy doesn't need a restart.
+    """
+    while True:
+        await asyncio.sleep(STATIC_CHECK_INTERVAL)
+        try:
+            changed = await asyncio.to_thread(static_files.reload)
+            if changed:
+                print(f"Static assets reloaded: {', '.join(changed)}")
+        except Exception as e:
+            print(f"Error reloading static assets: {e}")
+
+
+async def monitor_event_loop():
+    """
+    Measure how late the event loop wakes a task sleeping LOOP_LAG_INTERVAL, which is
+    how long requests wait behind work that blocks the loop.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every HTTP request by the route it matched, until its headers and until its last
+    body chunk are sent. A plain ASGI middleware, so responses pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        labels = {}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                # The router has set the matched route on the scope by the time a response starts
+                route = scope.get("route")
+                labels.update(
+                    route=route.path if route else "unmatched", method=scope["method"], status=message["status"]
+                )
+                REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                RESPONSE_SECONDS.observe(time.perf_counter() - started, **labels)
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+
+app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.on_event("startup")
@@ -98,117 +498,429 @@ async def startup_event():
     """
     Initialize the outages cache on startup.
     """
+    # Serve the last persisted snapshot right away; the refresher replaces it from SQLite
+    load_cache_from_file()
+    static_files.reload()
+    db.open_pool(DB_PATH)
     asyncio.create_task(update_outages_cache())
+    asyncio.create_task(watch_static_assets())
+    asyncio.create_task(monitor_event_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Close the pooled database connections.
+    """
+    db.close_pool()
+
+
+def serve_asset(request, asset, cache_control):
+    """
+    Serve an in-memory asset in the client's preferred encoding, or a 304 when the
+    client's cached copy is still current.
+    """
+    if asset is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    headers = {"Cache-Control": cache_control, "ETag": asset.etag, "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if asset.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), asset.payloads)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.payloads[encoding], media_type=asset.content_type, headers=headers)
 
 
 @app.get("/")
-async def serve_index():
-    """Serve the main HTML file."""
-    return FileResponse(INDEX_HTML)
+async def serve_index(request: Request):
+    """Serve the main HTML file, referencing the fingerprinted CSS and JavaScript."""
+    return serve_asset(request, static_files.get("index.html"), static_assets.REVALIDATE_CACHE_CONTROL)
 
 
 @app.get("/styles.css")
-async def serve_css():
+async def serve_css(request: Request):
     """Serve the CSS file."""
-    return FileResponse(CSS_FILE)
+    return serve_asset(request, static_files.get("styles.css"), static_assets.REVALIDATE_CACHE_CONTROL)
 
 
 @app.get("/script.js")
-async def serve_js():
+async def serve_js(request: Request):
     """Serve the JavaScript file."""
-    return FileResponse(JS_FILE)
+    return serve_asset(request, static_files.get("script.js"), static_assets.REVALIDATE_CACHE_CONTROL)
 
 @app.get("/feedback")
-async def serve_feedback():
+async def serve_feedback(request: Request):
     """Serve the feedback HTML file."""
-    feedback_file = "/root/ohub/ohub-fe/feedback.html"  # Adjust path if needed
-    return FileResponse(feedback_file)
+    return serve_asset(request, static_files.get("feedback.html"), static_assets.REVALIDATE_CACHE_CONTROL)
+
+@app.get("/static/{filename}")
+async def serve_static(request: Request, filename: str):
+    """
+    Serve a fingerprinted frontend asset. Its URL changes with its content, so it can be cached forever.
+    """
+    asset = static_files.by_url(static_assets.STATIC_PREFIX + filename)
+    return serve_asset(request, asset, static_assets.IMMUTABLE_CACHE_CONTROL)
+
+def resolve_detail(detail, zoom):
+    """
+    Polygon level of detail for a request: an explicit detail wins, else one derived
+    from the map zoom, else the original polygons. Raises ValueError when out of range.
+    """
+    if detail is not None:
+        if detail != 0 and detail not in outage_store.LOD_TOLERANCES:
+            raise ValueError(f"detail must be between 0 and {max(outage_store.LOD_TOLERANCES)}")
+        return detail
+    if zoom is not None:
+        return geometry.detail_for_zoom(zoom)
+    return 0
 
 @app.get("/preloaded-outages")
-async def get_preloaded_outages():
+async def get_preloaded_outages(request: Request, bbox: str = None, detail: int = None, zoom: int = None):
+    """
+    Serve preloaded outages data from the cache, using the pre-encoded payload for the client's encoding.
+    With a bbox (minLon,minLat,maxLon,maxLat) only the outages intersecting it are returned, and
+    detail (0-3) or zoom selects simplified polygons.
+    """
+    try:
+        level = resolve_detail(detail, zoom)
+        box = geometry.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    data, payloads = outages_cache["data"], outages_cache["payloads"]
+    if level in outages_cache["detail_payloads"]:
+        data, payloads = outages_cache["detail_data"][level], outages_cache["detail_payloads"][level]
+    if not data or not payloads:
+        return JSONResponse({"error": "Outages cache is empty"}, status_code=500)
+    if box:
+        return JSONResponse([
+            outage for outage, extent in zip(data, outages_cache["extents"])
+            if extent and geometry.extents_intersect(extent, box)
+        ])
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), payloads)
+    headers = {"Vary": "Accept-Encoding"}
+    if outages_cache["stale"]:
+        headers["X-Cache-Status"] = "stale"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(payloads[encoding], media_type="application/json", headers=headers)
+
+@app.get("/clusters")
+async def get_clusters(zoom: int, bbox: str = None):
+    """
+    Serve the outage clusters precomputed for a map zoom level, optionally limited to a bbox.
+    Each cluster carries its outage count and summed num_customers.
+    """
+    try:
+        box = geometry.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if not outages_cache["clusters"]:
+        return JSONResponse({"error": "Outages cache is empty"}, status_code=500)
+    return JSONResponse(clusters.clusters_for(outages_cache["clusters"], zoom, box))
+
+@app.get("/summary")
+async def get_summary():
+    """
+    Serve outage counts and customers out nationally, per province and per company,
+    each split into planned and unplanned. Maintained as each company's snapshot lands.
+    """
+    if outages_cache["summary"] is None:
+        return JSONResponse({"error": "Outages cache is empty"}, status_code=500)
+    return Response(outages_cache["summary"], media_type="application/json")
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Serve request, database, refresh and cache metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/timeseries")
+async def get_timeseries(
+    company: str = None, province: str = None, start: str = Query(None, alias="from"),
+    end: str = Query(None, alias="to"), step: str = "1h",
+):
     """
-    Serve preloaded outages data from the cache.
+    Serve customers out over time for a company, a province or (with neither) the whole
+    country, from the rollups maintained at ingest. from/to are ISO timestamps (default:
+    the last 48 hours) and step is 5m, 1h or 1d. Each point holds the peak values seen
+    within its bucket.
     """
-    if not outages_cache["data"]:
+    if company and province:
+        return JSONResponse({"error": "Pass either company or province, not both"}, status_code=400)
+    if step not in outage_store.ROLLUP_RESOLUTIONS:
+        return JSONResponse(
+            {"error": f"step must be one of {', '.join(outage_store.ROLLUP_RESOLUTIONS)}"}, status_code=400
+        )
+    try:
+        end_epoch = outage_store.timestamp_epoch(end) if end else int(time.time())
+        start_epoch = outage_store.timestamp_epoch(start) if start else end_epoch - 48 * 3600
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid timestamp: {e}"}, status_code=400)
+    if company:
+        scope, name = "company", company
+    elif province:
+        scope, name = "province", province.upper()
+    else:
+        scope, name = "national", outage_store.NATIONAL
+    resolution = outage_store.ROLLUP_RESOLUTIONS[step]
+
+    try:
+        # Start from the bucket containing `from`, so its point isn't cut off
+        rows = await db.rollups(scope, name, resolution, start_epoch - start_epoch % resolution, end_epoch)
+    except Exception as e:
+        print(f"Error fetching time series: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    points = [
+        {
+            "time": datetime.fromtimestamp(bucket, timezone.utc).isoformat(),
+            "customers_out": customers_out,
+            "outages": outage_count,
+            "max_outage": max_outage,
+        }
+        for bucket, customers_out, outage_count, max_outage in rows
+    ]
+    return JSONResponse({"scope": scope, "name": name, "step": step, "points": points})
+
+@app.get("/tiles/{z}/{x}/{y}.mvt")
+async def get_tile(z: int, x: int, y: int):
+    """
+    Serve the current outages as a Mapbox Vector Tile, clipped and quantized to the tile.
+    """
+    if not 0 <= z <= vector_tiles.MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        return JSONResponse({"error": "Tile coordinates out of range"}, status_code=400)
+    tiles = outages_cache["tiles"]
+    if tiles is None:
         return JSONResponse({"error": "Outages cache is empty"}, status_code=500)
-    return JSONResponse(outages_cache["data"])
+    content = await asyncio.to_thread(tiles.tile, z, x, y)
+    return Response(content, media_type="application/vnd.mapbox-vector-tile")
+
+@app.get("/outages/stream")
+async def stream_outages(request: Request):
+    """
+    Push outage updates as Server-Sent Events. Each cache refresh that changes data sends one
+    "outages" event with the added or changed outages ("upserts") and the removed ones; a
+    "resync" event means the client should (re)load /preloaded-outages. It is sent first to
+    every client that connects without the current event id in Last-Event-ID, and to one
+    that fell behind.
+    """
+    return StreamingResponse(
+        updates.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/outages/changes")
+async def get_outage_changes(after: int = 0, limit: int = 1000):
+    """
+    Serve changelog entries after an offset: outages added, updated or removed between
+    consecutive snapshots. Poll again with "next" as `after` to continue from there.
+    Entries older than archive.CHANGES_RETENTION_DAYS are pruned.
+    """
+    limit = max(1, min(limit, 10000))
+    try:
+        rows = await db.outage_changes(after, limit)
+    except Exception as e:
+        print(f"Error fetching outage changes: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    # The stored outage JSON is spliced in as-is rather than decoded and re-encoded
+    entries = [
+        '{"offset":%d,"power_company":%s,"id":%s,"change":%s,"time_stamp":%s,"outage":%s}' % (
+            offset, outage_store.payload_json(company), outage_store.payload_json(outage_id),
+            outage_store.payload_json(change), outage_store.payload_json(api_call_timestamp), outage or "null",
+        )
+        for offset, company, outage_id, change, api_call_timestamp, outage in rows
+    ]
+    next_offset = rows[-1][0] if rows else after
+    body = '{"changes":[%s],"next":%d}' % (",".join(entries), next_offset)
+    return Response(body, media_type="application/json")
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def encode_ndjson(outages):
+    """One JSON object per line."""
+    return "".join(
+        outage_store.payload_json(outage) + "\n" for outage in outages
+    ).encode("utf-8")
+
+def encode_csv(outages, header):
+    """CSV rows, preceded by a header row when `header`; polygons are written as JSON."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(outages[0].keys())
+    for outage in outages:
+        writer.writerow(
+            outage_store.payload_json(value) if isinstance(value, list) else value
+            for value in outage.values()
+        )
+    return buffer.getvalue().encode("utf-8")
+
+async def stream_encoded(chunks, first, format):
+    """Encode outage chunks as they arrive from the database; `first` was already fetched."""
+    try:
+        chunk, header = first, True
+        while chunk:
+            if format == "ndjson":
+                yield encode_ndjson(chunk)
+            else:
+                yield encode_csv(chunk, header)
+                header = False
+            chunk = await anext(chunks, None)
+    finally:
+        await chunks.aclose()
+
+def parse_fields(fields):
+    """The set of outage fields named in a comma-separated list; "geometry" is the polygon."""
+    names = frozenset(
+        "polygon" if name == "geometry" else name for name in (name.strip() for name in fields.split(",")) if name
+    )
+    unknown = names - set(outage_store.OUTAGE_FIELDS)
+    if unknown or not names:
+        raise ValueError(f"fields must be a list of {', '.join(outage_store.OUTAGE_FIELDS)}")
+    return names
+
+def encode_cursor(cursor):
+    """The opaque form of a (company, row key) keyset cursor handed to clients."""
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def decode_cursor(value):
+    try:
+        company, key = json.loads(base64.urlsafe_b64decode(value.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(company, str) or not isinstance(key, int):
+        raise ValueError("Invalid cursor")
+    return company, key
 
 @app.get("/outages")
-async def get_outages(timestamp: str = None):
+async def get_outages(
+    timestamp: str = None, bbox: str = None, detail: int = None, zoom: int = None, polygon: str = "list",
+    format: str = "json", company: list[str] = Query(None), planned: bool = None, min_customers: int = None,
+    fields: str = None, limit: int = None, cursor: str = None,
+):
     """
-    Fetch outage data filtered by a specific timestamp or the latest outages.
+    Fetch outage data filtered by a specific timestamp or the latest outages,
+    optionally limited to a bbox (minLon,minLat,maxLon,maxLat) through the R*Tree index
+    and with polygons simplified to a detail level (0-3) or one suited to a zoom.
+    polygon=polyline returns each polygon as its stored encoded polyline of (lat, lon)
+    points in a "geometry" field instead of a decoded "polygon" list.
+    format=ndjson or format=csv streams the rows as they are read instead of one JSON array.
+    company= (repeatable), planned= and min_customers= filter the outages, and
+    fields=id,latitude,... returns only those fields; columns that aren't needed are
+    never read. limit= returns one page ordered by company, with the cursor of the next
+    page in the X-Next-Cursor header; pass it back as cursor= to continue.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    try:
+        box = geometry.parse_bbox(bbox) if bbox else None
+        level = resolve_detail(detail, zoom)
+        after = decode_cursor(cursor) if cursor else None
+        names = parse_fields(fields) if fields else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if polygon not in ("list", "polyline"):
+        return JSONResponse({"error": "polygon must be list or polyline"}, status_code=400)
+    encoded = polygon == "polyline"
+    if format not in ("json", *STREAM_MEDIA_TYPES):
+        return JSONResponse({"error": "format must be json, ndjson or csv"}, status_code=400)
+    if limit is None and after is not None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    filters = db.OutageFilter(tuple(company or ()), planned, min_customers, names, after, limit)
+
+    if limit is not None:
+        try:
+            outages, next_cursor = await db.outages_page(timestamp, box, level, encoded, filters)
+        except Exception as e:
+            print(f"Error fetching outages: {e}")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        headers = {"X-Next-Cursor": encode_cursor(next_cursor)} if next_cursor else {}
+        if format == "ndjson":
+            return Response(encode_ndjson(outages), media_type=STREAM_MEDIA_TYPES[format], headers=headers)
+        if format == "csv":
+            body = encode_csv(outages, True) if outages else b""
+            return Response(body, media_type=STREAM_MEDIA_TYPES[format], headers=headers)
+        return JSONResponse(outages, headers=headers)
+
+    if format in STREAM_MEDIA_TYPES:
+        chunks = db.iter_outages(timestamp, box, level, encoded, filters)
+        try:
+            # Fetch the first chunk up front so query errors still get a proper status code
+            first = await anext(chunks, [])
+        except Exception as e:
+            await chunks.aclose()
+            print(f"Error fetching outages: {e}")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        return StreamingResponse(stream_encoded(chunks, first, format), media_type=STREAM_MEDIA_TYPES[format])
 
     try:
         if timestamp:
             # Fetch the latest outage data for each power company up to the given timestamp
-            query = """
-                SELECT id, municipality, area, cause, numCustomersOut, 
-                       crewStatusDescription, latitude, longitude, 
-                       dateOff, crewEta, polygon, company, planned,
-                       apiCallTimestamp
-                FROM outages
-                WHERE apiCallTimestamp IN (
-                    SELECT MAX(apiCallTimestamp)
-                    FROM outages
-                    WHERE apiCallTimestamp <= ?
-                    GROUP BY company
-                )
-            """
-            rows = cursor.execute(query, (timestamp,)).fetchall()
+            outages = await db.outages_as_of(timestamp, box, level, encoded, filters)
         else:
             # Fetch the latest outage data for each power company
-            query = """
-                SELECT id, municipality, area, cause, numCustomersOut, 
-                       crewStatusDescription, latitude, longitude, 
-                       dateOff, crewEta, polygon, company, planned,
-                       apiCallTimestamp
-                FROM outages
-                WHERE apiCallTimestamp IN (
-                    SELECT MAX(apiCallTimestamp)
-                    FROM outages
-                    GROUP BY company
-                )
-            """
-            rows = cursor.execute(query).fetchall()
-
-        # Process the rows into a JSON-compatible structure
-        outages = [
-            {
-                "id": row[0],
-                "municipality": row[1],
-                "area": row[2],
-                "cause": row[3],
-                "num_customers": row[4],
-                "crew_status": row[5],
-                "latitude": row[6],
-                "longitude": row[7],
-                "date_off": row[8],
-                "crew_eta": row[9],
-                "polygon": json.loads(row[10]) if row[10] else [],
-                "power_company": row[11],
-                "planned": row[12],
-                "time_stamp": row[13],
-            }
-            for row in rows
-        ]
+            outages = await db.latest_outages(box, level, encoded, filters)
         return JSONResponse(outages)
 
     except Exception as e:
         print(f"Error fetching outages: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
-    finally:
-        conn.close()
+@app.get("/export")
+async def export_history(
+    background_tasks: BackgroundTasks, start: str = Query(..., alias="from"), end: str = Query(..., alias="to"),
+    company: list[str] = Query(None), format: str = "parquet",
+):
+    """
+    Export the outage snapshots taken between from (inclusive) and to (exclusive), optionally
+    for some companies (repeat company=), as a Parquet or Arrow IPC file.
+    """
+    if export.pa is None:
+        return JSONResponse({"error": "Export requires pyarrow, which is not installed"}, status_code=501)
+    if format not in export.FORMATS:
+        return JSONResponse({"error": f"format must be one of {', '.join(export.FORMATS)}"}, status_code=400)
+    try:
+        outage_store.timestamp_epoch(start)
+        outage_store.timestamp_epoch(end)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid timestamp: {e}"}, status_code=400)
+
+    # Written chunk by chunk to a temporary file on a pooled connection, then streamed from disk
+    fd, path = tempfile.mkstemp(prefix="ohub-export-", suffix=f".{format}")
+    os.close(fd)
+    try:
+        await db.export_outages(path, start, end, company, format)
+    except Exception as e:
+        os.unlink(path)
+        print(f"Error exporting outages: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    background_tasks.add_task(os.unlink, path)
+    return FileResponse(
+        path, media_type=export.MEDIA_TYPES[format], filename=f"outages-{start[:10]}-{end[:10]}.{format}"
+    )
 
 @app.get("/weather-alerts")
 async def get_weather_alerts():
     """
     Serve the matched weather alerts with polygons from the JSON file.
     """
-    alerts_file_path = "/root/ohub/ohub-be/weather_api/matched_weather_alerts_with_polygons.json"
-    if os.path.exists(alerts_file_path):
-        return FileResponse(alerts_file_path)
+    if os.path.exists(ALERTS_FILE):
+        return FileResponse(ALERTS_FILE)
     return JSONResponse({"error": "File not found"}, status_code=404)
+
+
+@app.get("/alerts/{alert_id}/outages")
+async def get_alert_outages(alert_id: str):
+    """
+    Serve the cached outages covered by a weather alert's polygons.
+    """
+    if weather_alerts.STRtree is None:
+        return JSONResponse({"error": "Weather alert matching is unavailable"}, status_code=501)
+    alert_outages = outages_cache["alert_outages"].get(alert_id)
+    if alert_outages is None:
+        return JSONResponse({"error": f"Unknown or expired alert: {alert_id}"}, status_code=404)
+    return JSONResponse(alert_outages)
@@ -0,0 +1,249 @@
+"""
+One-off upgrade of an outages database to outage_store.SCHEMA_VERSION.
+
+Databases created before the schema was versioned may lack some of the later columns
+and tables, or the data backfilled into them: polygons moved from JSON to the encoded
+geometry columns, extents, the snapshots manifest and its totals, levels of detail
+and rollups. outage_store.connect refuses such a database, so stop the scrapers and
+the API, then run:
+
+    python3 migrate.py [db_file] [--no-backup]
+
+A backup copy is taken first with SQLite's online backup API, as encoding polygons
+rounds them to 5 decimal places and drops their JSON. The quick schema changes are
+committed together with the list of backfills still to do; each backfill commits in
+batches and is crossed off that list once done, so an interrupted run picks up where
+it stopped. The version is only set when every backfill is done.
+"""
+import argparse
+from datetime import datetime, timezone
+import sqlite3
+
+import geometry
+import outage_store
+
+BATCH_SIZE = 10000  # Rows (or snapshots) per committed batch
+
+# Backfills, in the order they run
+STEPS = ("snapshot_totals", "encode_polygons", "extents", "manifest", "polygon_lods", "rollups")
+
+
+def _table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def backup(conn, db_file):
+    """Copy the database next to itself; returns the copy's path."""
+    path = f"{db_file}.backup-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+    target = sqlite3.connect(path)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+    return path
+
+
+def _plan(conn):
+    """
+    Make the schema changes that are quick (new columns and tables) and return the
+    backfills the data then needs. Runs in the caller's transaction.
+    """
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    steps = set()
+    has_manifest = "snapshots" in existing
+    if has_manifest:
+        columns = _table_columns(conn, "snapshots")
+        if "intervals" not in columns:
+            conn.execute("ALTER TABLE snapshots ADD COLUMN intervals INTEGER NOT NULL DEFAULT 0")
+        if "partitionMonth" not in columns:
+            conn.execute("ALTER TABLE snapshots ADD COLUMN partitionMonth TEXT")
+        if "customersOut" not in columns:
+            conn.execute("ALTER TABLE snapshots ADD COLUMN customersOut INTEGER")
+            conn.execute("ALTER TABLE snapshots ADD COLUMN maxOutage INTEGER")
+            steps.add("snapshot_totals")
+    if "polygon_lods" in existing and "geometry" not in _table_columns(conn, "polygon_lods"):
+        # Levels of detail stored as JSON are rebuilt in the canonical encoding
+        conn.execute("DROP TABLE polygon_lods")
+        existing.discard("polygon_lods")
+    if "outages" in existing and "geometry" not in _table_columns(conn, "outages"):
+        conn.execute("ALTER TABLE outages ADD COLUMN geometry TEXT")
+        conn.execute("ALTER TABLE outages ADD COLUMN polygonLayout INTEGER")
+        steps.add("encode_polygons")
+    outage_store.create_schema(conn)
+    if "outage_extents" not in existing:
+        steps.add("extents")
+    if not has_manifest:
+        steps.add("manifest")
+    if "polygon_lods" not in existing:
+        steps.add("polygon_lods")
+    if "outage_rollups" not in existing:
+        steps.add("rollups")
+    return [step for step in STEPS if step in steps]
+
+
+def _snapshot_totals(conn):
+    while True:
+        keys = conn.execute(
+            "SELECT company, apiCallTimestamp FROM snapshots WHERE customersOut IS NULL LIMIT ?", (BATCH_SIZE,)
+        ).fetchall()
+        if not keys:
+            return
+        conn.executemany(
+            """
+            UPDATE snapshots SET (customersOut, maxOutage) = (
+                SELECT COALESCE(SUM(CAST(o.numCustomersOut AS INTEGER)), 0),
+                       COALESCE(MAX(CAST(o.numCustomersOut AS INTEGER)), 0)
+                FROM outages o
+                WHERE o.company = ? AND o.apiCallTimestamp = ?
+            )
+            WHERE company = ? AND apiCallTimestamp = ?
+            """,
+            [(company, timestamp, company, timestamp) for company, timestamp in keys],
+        )
+        conn.commit()
+
+
+def _encode_polygons(conn):
+    last_rowid = 0
+    while True:
+        batch = conn.execute(
+            "SELECT rowid, polygon FROM outages WHERE rowid > ? AND polygon IS NOT NULL ORDER BY rowid LIMIT ?",
+            (last_rowid, BATCH_SIZE),
+        ).fetchall()
+        if not batch:
+            return
+        updates = []
+        for rowid, polygon in batch:
+            try:
+                encoded, layout = geometry.encode_polygon(polygon)
+            except (ValueError, TypeError, IndexError):
+                continue  # Rows whose polygon can't be parsed keep their JSON
+            updates.append((encoded, layout, rowid))
+        conn.executemany(
+            "UPDATE outages SET geometry = ?, polygonLayout = ?, polygon = NULL WHERE rowid = ?", updates
+        )
+        conn.commit()
+        last_rowid = batch[-1][0]
+
+
+def _extents(conn):
+    last_rowid = 0
+    while True:
+        batch = conn.execute(
+            outage_store.POLYGON_ROWS + " WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, BATCH_SIZE)
+        ).fetchall()
+        if not batch:
+            return
+        outage_store.index_extents(conn, outage_store.decoded_polygons(batch))
+        conn.commit()
+        last_rowid = batch[-1][0]
+
+
+def _manifest(conn):
+    companies = [company for (company,) in conn.execute(
+        "SELECT DISTINCT company FROM outages WHERE company IS NOT NULL"
+    ).fetchall()]
+    for company in companies:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO snapshots (company, apiCallTimestamp, rowCount, customersOut, maxOutage)
+            SELECT company, apiCallTimestamp, COUNT(*),
+                   COALESCE(SUM(CAST(numCustomersOut AS INTEGER)), 0),
+                   COALESCE(MAX(CAST(numCustomersOut AS INTEGER)), 0)
+            FROM outages
+            WHERE company = ? AND apiCallTimestamp IS NOT NULL
+            GROUP BY apiCallTimestamp
+            """,
+            (company,),
+        )
+        conn.commit()
+
+
+def _polygon_lods(conn):
+    # Only the latest snapshots get levels of detail; older history keeps serving full polygons
+    for company, api_call_timestamp in conn.execute(outage_store.LATEST_SNAPSHOTS_QUERY).fetchall():
+        rows = conn.execute(
+            outage_store.POLYGON_ROWS + " WHERE company = ? AND apiCallTimestamp = ?", (company, api_call_timestamp)
+        ).fetchall()
+        outage_store.index_polygon_lods(
+            conn, [(rowid, polygon) for rowid, polygon, _, _ in outage_store.decoded_polygons(rows)]
+        )
+        conn.commit()
+
+
+def _rollups(conn):
+    # Replayed in time order so provincial and national totals carry forward correctly. Buckets
+    # keep peaks, so replaying snapshots again after an interruption changes nothing.
+    snapshots = conn.execute(
+        "SELECT company, apiCallTimestamp, rowCount, customersOut, maxOutage FROM snapshots ORDER BY apiCallTimestamp"
+    ).fetchall()
+    for index, (company, api_call_timestamp, row_count, customers_out, max_outage) in enumerate(snapshots, 1):
+        try:
+            outage_store.rollup_snapshot(
+                conn, company, api_call_timestamp, row_count, customers_out or 0, max_outage or 0
+            )
+        except ValueError:
+            continue
+        if index % BATCH_SIZE == 0:
+            conn.commit()
+    conn.commit()
+
+
+BACKFILLS = {
+    "snapshot_totals": _snapshot_totals,
+    "encode_polygons": _encode_polygons,
+    "extents": _extents,
+    "manifest": _manifest,
+    "polygon_lods": _polygon_lods,
+    "rollups": _rollups,
+}
+
+
+def migrate(db_file=outage_store.DB_FILE, make_backup=True):
+    """Bring db_file to SCHEMA_VERSION. Returns the backfills that ran."""
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {outage_store.BUSY_TIMEOUT_MS}")
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        if version == outage_store.SCHEMA_VERSION:
+            return []
+        if version > outage_store.SCHEMA_VERSION:
+            raise RuntimeError(f"{db_file} is at schema version {version}, newer than this code")
+        planned = "schema_migrations" in {
+            name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        if not planned:
+            if make_backup:
+                print(f"Backed up {db_file} to {backup(conn, db_file)}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TABLE schema_migrations (step TEXT PRIMARY KEY)")
+                conn.executemany("INSERT INTO schema_migrations VALUES (?)", [(step,) for step in _plan(conn)])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        pending = {step for (step,) in conn.execute("SELECT step FROM schema_migrations")}
+        steps = [step for step in STEPS if step in pending]
+        for step in steps:
+            print(f"Backfilling {step}")
+            BACKFILLS[step](conn)
+            conn.execute("DELETE FROM schema_migrations WHERE step = ?", (step,))
+            conn.commit()
+        conn.execute("DROP TABLE schema_migrations")
+        conn.execute(f"PRAGMA user_version = {outage_store.SCHEMA_VERSION}")
+        conn.commit()
+        return steps
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade an outages database to the current schema.")
+    parser.add_argument("db_file", nargs="?", default=outage_store.DB_FILE)
+    parser.add_argument("--no-backup", action="store_true", help="Skip the backup copy")
+    args = parser.parse_args()
+    steps = migrate(args.db_file, not args.no_backup)
+    done = f" after backfilling {', '.join(steps)}" if steps else ""
+    print(f"{args.db_file} is at schema version {outage_store.SCHEMA_VERSION}{done}")
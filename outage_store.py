@@ -0,0 +1,847 @@
+"""
+Shared storage for the outage scrapers and the API.
+
+Every scraper run stores one snapshot: all of a company's current outages with a
+common apiCallTimestamp. store_snapshot writes those rows together with an entry in
+the snapshots manifest, in the same transaction, so readers can find the latest (or
+as-of) snapshot for each company with an indexed lookup instead of scanning outages.
+
+With STORAGE_MODE = "intervals", outages only holds each company's current rows,
+updated in place, and history is kept in outage_intervals: one row per version of an
+outage, from the first to the last snapshot that showed it unchanged. The manifest
+records which mode each snapshot was stored in, so as-of queries read the right table.
+
+Scrapers hand over polygons in their source's shape; store_snapshot keeps them in the
+canonical geometry/polygonLayout columns (see geometry.encode_polygon) instead of as JSON
+text. The polygon column only still holds JSON for rows that could not be encoded.
+"""
+import ast
+from datetime import datetime, timezone
+import glob
+import json
+import os
+import re
+import sqlite3
+
+import geometry
+
+DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
+STORAGE_MODE = "snapshots"  # "snapshots" keeps every run's rows; "intervals" keeps outage lifetimes
+BUSY_TIMEOUT_MS = 30000  # How long a writer waits for another one's transaction, e.g. an archive batch
+SCHEMA_VERSION = 1  # PRAGMA user_version of a database with SCHEMA and every migrate.py backfill applied
+
+OUTAGE_COLUMNS = (
+    "id", "municipality", "area", "cause", "numCustomersOut",
+    "crewStatusDescription", "latitude", "longitude",
+    "dateOff", "crewEta", "polygon", "company", "planned", "apiCallTimestamp",
+)
+
+# Scrapers live in power_api/<province>/, each naming its company in a COMPANY_NAME constant
+SCRAPERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "power_api")
+
+
+def scraper_provinces(scrapers_dir=SCRAPERS_DIR):
+    """
+    {company: province code} from the COMPANY_NAME of every scraper under scrapers_dir.
+    The scrapers are parsed rather than imported, as importing them needs their HTTP clients.
+    """
+    provinces = {}
+    for path in sorted(glob.glob(os.path.join(scrapers_dir, "*", "*.py"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                module = ast.parse(f.read(), path)
+        except (OSError, SyntaxError, ValueError) as e:
+            print(f"Error reading scraper {path}: {e}")
+            continue
+        for node in module.body:
+            if (
+                isinstance(node, ast.Assign)
+                and any(isinstance(target, ast.Name) and target.id == "COMPANY_NAME" for target in node.targets)
+                and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)
+            ):
+                provinces[node.value.value] = os.path.basename(os.path.dirname(path)).upper()
+    return provinces
+
+
+COMPANY_PROVINCES = scraper_provinces()
+
+# Columns of a stored row: OUTAGE_COLUMNS followed by the canonical polygon encoding
+STORED_COLUMNS = OUTAGE_COLUMNS + ("geometry", "polygonLayout")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS outages (
+        id TEXT,
+        municipality TEXT,
+        area TEXT,
+        cause TEXT,
+        numCustomersOut INTEGER,
+        crewStatusDescription TEXT,
+        latitude REAL,
+        longitude REAL,
+        dateOff TEXT,
+        crewEta TEXT,
+        polygon TEXT,
+        company TEXT,
+        planned INTEGER DEFAULT 0,
+        apiCallTimestamp TEXT,
+        geometry TEXT,  -- encoded polyline of (lat, lon) points
+        polygonLayout INTEGER  -- shape the polygon came in, see geometry.LAYOUT_*
+    );
+    CREATE INDEX IF NOT EXISTS idx_outages_company_timestamp
+        ON outages (company, apiCallTimestamp);
+    CREATE TABLE IF NOT EXISTS snapshots (
+        company TEXT NOT NULL,
+        apiCallTimestamp TEXT NOT NULL,
+        rowCount INTEGER NOT NULL,
+        customersOut INTEGER,  -- sum of numCustomersOut
+        maxOutage INTEGER,  -- largest single numCustomersOut
+        intervals INTEGER NOT NULL DEFAULT 0,  -- 1 when the rows are in outage_intervals
+        partitionMonth TEXT,  -- archive partition holding the rows (see archive.py), NULL while hot
+        PRIMARY KEY (company, apiCallTimestamp)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS polygon_lods (
+        outage_rowid INTEGER NOT NULL,  -- rowid of the outages row
+        level INTEGER NOT NULL,
+        geometry TEXT NOT NULL,  -- encoded polyline, same layout as the outage's polygon
+        PRIMARY KEY (outage_rowid, level)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS outage_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,  -- the changelog offset
+        company TEXT NOT NULL,
+        outageId TEXT,
+        change TEXT NOT NULL,  -- 'added', 'updated' or 'removed'
+        apiCallTimestamp TEXT NOT NULL,
+        outage TEXT  -- the outage in API shape as JSON; NULL when removed
+    );
+    CREATE TABLE IF NOT EXISTS outage_rollups (
+        scope TEXT NOT NULL,  -- 'company', 'province' or 'national'
+        name TEXT NOT NULL,  -- company name, province code or 'CA'
+        resolution INTEGER NOT NULL,  -- bucket width in seconds
+        bucket INTEGER NOT NULL,  -- bucket start, Unix seconds
+        customersOut INTEGER NOT NULL,
+        outageCount INTEGER NOT NULL,
+        maxOutage INTEGER NOT NULL,
+        PRIMARY KEY (scope, name, resolution, bucket)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS outage_intervals (
+        id TEXT,
+        municipality TEXT,
+        area TEXT,
+        cause TEXT,
+        numCustomersOut INTEGER,
+        crewStatusDescription TEXT,
+        latitude REAL,
+        longitude REAL,
+        dateOff TEXT,
+        crewEta TEXT,
+        polygon TEXT,
+        company TEXT NOT NULL,
+        planned INTEGER DEFAULT 0,
+        firstSeen TEXT NOT NULL,  -- apiCallTimestamp of the first snapshot showing this version
+        lastSeen TEXT NOT NULL,  -- apiCallTimestamp of the last one
+        geometry TEXT,
+        polygonLayout INTEGER,
+        outageRowid INTEGER  -- rowid of the current outages row while the version is live
+    );
+    CREATE INDEX IF NOT EXISTS idx_outage_intervals_company_last_seen
+        ON outage_intervals (company, lastSeen);
+    CREATE INDEX IF NOT EXISTS idx_outage_intervals_outage_rowid
+        ON outage_intervals (outageRowid);
+    CREATE VIRTUAL TABLE IF NOT EXISTS outage_extents USING rtree(
+        id,  -- rowid of the outages row
+        minLon, maxLon,
+        minLat, maxLat
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS interval_extents USING rtree(
+        id,  -- rowid of the outage_intervals row
+        minLon, maxLon,
+        minLat, maxLat
+    );
+"""
+
+# Latest snapshot per company, optionally bounded by an as-of timestamp. The recursive
+# CTE walks the distinct companies through the manifest's primary key, so every step is
+# an index seek rather than a scan of the whole manifest. {companies} can limit it to
+# some companies.
+_LATEST_SNAPSHOTS = """
+    WITH RECURSIVE companies(company) AS (
+        SELECT MIN(company) FROM snapshots
+        UNION ALL
+        SELECT (SELECT MIN(company) FROM snapshots WHERE company > companies.company)
+        FROM companies
+        WHERE company IS NOT NULL
+    ),
+    latest(company, apiCallTimestamp) AS (
+        SELECT company, (
+            SELECT MAX(s.apiCallTimestamp)
+            FROM snapshots s
+            WHERE s.company = companies.company {as_of}
+        )
+        FROM companies
+        WHERE company IS NOT NULL {companies}
+    )
+"""
+
+LATEST_SNAPSHOTS_QUERY = _LATEST_SNAPSHOTS.format(as_of="", companies="") + """
+    SELECT company, apiCallTimestamp FROM latest WHERE apiCallTimestamp IS NOT NULL
+"""
+
+COMPANY_WATERMARK_QUERY = "SELECT MAX(apiCallTimestamp) FROM snapshots WHERE company = ?"
+
+# Polygon simplification tolerances, in degrees, for each stored level of detail.
+# Level 0 is the original polygon.
+LOD_TOLERANCES = {1: 0.0001, 2: 0.001, 3: 0.01}
+
+# Rollup bucket widths in seconds, by the step names /timeseries accepts
+ROLLUP_RESOLUTIONS = {"5m": 300, "1h": 3600, "1d": 86400}
+NATIONAL = "CA"
+
+# Every company's latest manifest entry as of a timestamp, with its totals
+_SNAPSHOT_TOTALS_AS_OF = _LATEST_SNAPSHOTS.format(as_of="AND s.apiCallTimestamp <= ?", companies="") + """
+    SELECT s.company, s.rowCount, s.customersOut, s.maxOutage
+    FROM latest
+    JOIN snapshots s ON s.company = latest.company AND s.apiCallTimestamp = latest.apiCallTimestamp
+"""
+
+# Archive partitions holding the rows of every company's as-of snapshot
+AS_OF_PARTITIONS_QUERY = _LATEST_SNAPSHOTS.format(as_of="AND s.apiCallTimestamp <= ?", companies="") + """
+    SELECT DISTINCT s.partitionMonth
+    FROM latest
+    JOIN snapshots s ON s.company = latest.company AND s.apiCallTimestamp = latest.apiCallTimestamp
+    WHERE s.partitionMonth IS NOT NULL
+"""
+
+ROLLUPS_QUERY = """
+    SELECT bucket, customersOut, outageCount, maxOutage
+    FROM outage_rollups
+    WHERE scope = ? AND name = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+    ORDER BY bucket
+"""
+
+OUTAGE_CHANGES_QUERY = """
+    SELECT id, company, outageId, change, apiCallTimestamp, outage
+    FROM outage_changes
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+# The row key (a rowid) is unique within a company's snapshot and orders keyset pages
+SNAPSHOT_OUTAGES_COLUMNS = (
+    "o.id", "o.municipality", "o.area", "o.cause", "o.numCustomersOut",
+    "o.crewStatusDescription", "o.latitude", "o.longitude",
+    "o.dateOff", "o.crewEta", "o.polygon", "o.company", "o.planned",
+    "o.apiCallTimestamp", "{geometry}", "o.polygonLayout", "o.rowid",
+)
+
+INTERVAL_OUTAGES_COLUMNS = (
+    "i.id", "i.municipality", "i.area", "i.cause", "i.numCustomersOut",
+    "i.crewStatusDescription", "i.latitude", "i.longitude",
+    "i.dateOff", "i.crewEta", "i.polygon", "i.company", "i.planned",
+    "latest.apiCallTimestamp", "i.geometry", "i.polygonLayout", "i.rowid",
+)
+
+# API field of the first 14 SNAPSHOT_OUTAGES_COLUMNS (see row_to_outage). The polygon is
+# stored across positions 10, 14 and 15 and returned as "polygon", or encoded as "geometry".
+OUTAGE_FIELDS = (
+    "id", "municipality", "area", "cause", "num_customers",
+    "crew_status", "latitude", "longitude",
+    "date_off", "crew_eta", "polygon", "power_company", "planned",
+    "time_stamp",
+)
+
+# outage_intervals columns written for each new version, in STORED_COLUMNS order with
+# apiCallTimestamp as firstSeen, then lastSeen and outageRowid
+INTERVAL_COLUMNS = (
+    STORED_COLUMNS[:13] + ("firstSeen",) + STORED_COLUMNS[14:] + ("lastSeen", "outageRowid")
+)
+
+POLYGON_ROWS = "SELECT rowid, polygon, geometry, polygonLayout, latitude, longitude FROM outages"
+
+
+def _select_columns(columns, fields, polygon):
+    """
+    The SELECT list of an outages_query branch, with every column outside `fields`
+    replaced by NULL so SQLite never reads it. The company and row key are always read.
+    """
+    selected = []
+    for position, column in enumerate(columns):
+        field = "polygon" if position in (14, 15) else OUTAGE_FIELDS[position] if position < 14 else None
+        if fields is not None and field not in fields and field not in (None, "power_company"):
+            column = "NULL"
+        selected.append(column.format(geometry=polygon))
+    return ", ".join(selected)
+
+
+def _branch_filters(table, bbox, planned, min_customers, after):
+    """The WHERE clause of an outages_query branch reading `table` ("o" or "i")."""
+    conditions = []
+    if bbox:
+        conditions.append("e.maxLon >= ? AND e.minLon <= ? AND e.maxLat >= ? AND e.minLat <= ?")
+    if planned:
+        conditions.append(f"IFNULL({table}.planned, 0) = ?")
+    if min_customers:
+        # Counts a source gave as text ("Unknown", "<5") stay text despite the column's affinity, and
+        # text sorts above every number; cast so they count as 0 instead of always passing
+        conditions.append(f"CAST({table}.numCustomersOut AS INTEGER) >= ?")
+    if after:
+        conditions.append(f"(latest.company, {table}.rowid) > (?, ?)")
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def outages_query(
+    as_of=False, company=False, detail=False, bbox=False, partitions=None,
+    companies=0, planned=False, min_customers=False, fields=None, after=False, limit=False,
+):
+    """
+    Build a query returning outage rows in SNAPSHOT_OUTAGES_COLUMNS order.
+
+    By default it selects every company's latest snapshot; `as_of` bounds that by a
+    timestamp, and `company` instead selects one company's latest snapshot.
+    `companies` limits the snapshots to that many companies. `detail` swaps in the
+    simplified geometry of a level from polygon_lods (falling back to the original),
+    and `bbox` keeps outages whose extent intersects a box. `planned` and
+    `min_customers` filter on those columns. `fields` (a set of OUTAGE_FIELDS) reads
+    only those columns, leaving the others NULL. `limit` orders the rows by company and
+    row key and returns one page of them; `after` starts that page past a keyset cursor.
+
+    Parameters bind in the same order: the as-of timestamp or the company, the
+    companies, the detail level, then filter_params(...), then the limit. As-of queries
+    also read snapshots stored in interval mode, at full detail, and take filter_params
+    a second time. `partitions` maps archive months to the schema names they are attached
+    as; an as-of query reads those months' snapshots from them, at full detail, taking
+    filter_params once more per partition.
+    """
+    filters = (bbox, planned, min_customers, after)
+    encoded = "COALESCE(l.geometry, o.geometry)" if detail else "o.geometry"
+    columns = _select_columns(SNAPSHOT_OUTAGES_COLUMNS, fields, encoded)
+    if company:
+        # Looked up rather than bound, as interval-mode runs move the rows' timestamp forward
+        snapshots = """
+            WITH latest(company, apiCallTimestamp) AS (
+                SELECT company, MAX(apiCallTimestamp) FROM snapshots WHERE company = ?
+            )
+        """
+    else:
+        snapshots = _LATEST_SNAPSHOTS.format(
+            as_of="AND s.apiCallTimestamp <= ?" if as_of else "",
+            companies=f"AND company IN ({', '.join('?' * companies)})" if companies else "",
+        )
+    sql = snapshots + f"""
+        SELECT {columns}
+        FROM latest
+        JOIN outages o
+          ON o.company = latest.company AND o.apiCallTimestamp = latest.apiCallTimestamp
+    """
+    if as_of:
+        # In interval mode the outages rows at a snapshot's timestamp are just its current rows
+        sql += """
+            JOIN snapshots s ON s.company = latest.company
+             AND s.apiCallTimestamp = latest.apiCallTimestamp AND NOT s.intervals
+        """
+    if detail:
+        sql += " LEFT JOIN polygon_lods l ON l.outage_rowid = o.rowid AND l.level = ?"
+    if bbox:
+        sql += " JOIN outage_extents e ON e.id = o.rowid"
+    sql += _branch_filters("o", *filters)
+    if not as_of:
+        if limit:
+            return sql + " ORDER BY o.company, o.rowid LIMIT ?"
+        return sql + " ORDER BY o.rowid"
+    sql += f"""
+        UNION ALL
+        SELECT {_select_columns(INTERVAL_OUTAGES_COLUMNS, fields, None)}
+        FROM latest
+        JOIN snapshots s ON s.company = latest.company
+         AND s.apiCallTimestamp = latest.apiCallTimestamp AND s.intervals
+        JOIN outage_intervals i
+          ON i.company = latest.company
+         AND i.lastSeen >= latest.apiCallTimestamp AND i.firstSeen <= latest.apiCallTimestamp
+    """
+    if bbox:
+        sql += " JOIN interval_extents e ON e.id = i.rowid"
+    sql += _branch_filters("i", *filters)
+    for month, schema in sorted((partitions or {}).items()):
+        sql += f"""
+            UNION ALL
+            SELECT {_select_columns(SNAPSHOT_OUTAGES_COLUMNS, fields, "o.geometry")}
+            FROM latest
+            JOIN snapshots s ON s.company = latest.company
+             AND s.apiCallTimestamp = latest.apiCallTimestamp AND s.partitionMonth = '{month}'
+            JOIN {schema}.outages o
+              ON o.company = latest.company AND o.apiCallTimestamp = latest.apiCallTimestamp
+        """
+        if bbox:
+            sql += f" JOIN {schema}.outage_extents e ON e.id = o.rowid"
+        sql += _branch_filters("o", *filters)
+    # A compound select can only be ordered by result columns: company, then id or row key
+    if limit:
+        return sql + " ORDER BY 12, 17 LIMIT ?"
+    return sql + " ORDER BY 12, 1"
+
+
+def bbox_params(bbox):
+    """Bind order of a (minLon, minLat, maxLon, maxLat) box in outages_query."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (min_lon, max_lon, min_lat, max_lat)
+
+
+def filter_params(bbox=None, planned=None, min_customers=None, after=None):
+    """Bind order of one outages_query branch's filters; None leaves a filter out."""
+    params = ()
+    if bbox is not None:
+        params += bbox_params(bbox)
+    if planned is not None:
+        params += (int(planned),)
+    if min_customers is not None:
+        params += (min_customers,)
+    if after is not None:
+        params += tuple(after)
+    return params
+
+
+def decoded_polygons(rows):
+    """Turn POLYGON_ROWS rows into (rowid, polygon, latitude, longitude) with decoded polygons."""
+    for rowid, polygon, encoded, layout, latitude, longitude in rows:
+        try:
+            polygon = geometry.stored_polygon(polygon, encoded, layout)
+        except (ValueError, TypeError, IndexError):
+            polygon = []
+        yield rowid, polygon, latitude, longitude
+
+
+def index_extents(conn, rows, table="outage_extents"):
+    """Add (rowid, decoded polygon, latitude, longitude) rows to an extents R*Tree."""
+    extents = []
+    for rowid, polygon, latitude, longitude in rows:
+        try:
+            extent = geometry.outage_extent(polygon, latitude, longitude)
+        except (ValueError, TypeError, IndexError):
+            extent = None
+        if extent:
+            min_lon, min_lat, max_lon, max_lat = extent
+            extents.append((rowid, min_lon, max_lon, min_lat, max_lat))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} (id, minLon, maxLon, minLat, maxLat) VALUES (?, ?, ?, ?, ?)",
+        extents,
+    )
+
+
+def index_polygon_lods(conn, rows, simplify=geometry.simplify_polygon):
+    """
+    Store simplified levels of detail for (rowid, decoded polygon) rows. A level is only stored
+    when it drops points; readers fall back to the original polygon otherwise. When a
+    coarse tolerance would collapse the polygon, the previous level is reused. `simplify`
+    replaces geometry.simplify_polygon, e.g. with a memoized one.
+    """
+    lods = []
+    for rowid, polygon in rows:
+        try:
+            previous = None
+            for level, tolerance in sorted(LOD_TOLERANCES.items()):
+                simplified = simplify(polygon, tolerance) or previous
+                if simplified is not None:
+                    lods.append((rowid, level, geometry.encode_polygon(simplified)[0]))
+                    previous = simplified
+        except (ValueError, TypeError, IndexError):
+            continue
+    conn.executemany(
+        "INSERT OR REPLACE INTO polygon_lods (outage_rowid, level, geometry) VALUES (?, ?, ?)", lods
+    )
+
+
+def index_snapshot(conn, company_name, api_call_timestamp, simplify=geometry.simplify_polygon):
+    """Derive the extents and polygon levels of detail for one stored snapshot."""
+    rows = list(decoded_polygons(conn.execute(
+        POLYGON_ROWS + " WHERE company = ? AND apiCallTimestamp = ?", (company_name, api_call_timestamp)
+    )))
+    index_extents(conn, rows)
+    index_polygon_lods(conn, [(rowid, polygon) for rowid, polygon, _, _ in rows], simplify)
+
+
+def index_outage_rows(conn, rowids, simplify=geometry.simplify_polygon):
+    """Rebuild the extents and polygon levels of detail of individual outages rows."""
+    conn.executemany("DELETE FROM outage_extents WHERE id = ?", [(rowid,) for rowid in rowids])
+    conn.executemany("DELETE FROM polygon_lods WHERE outage_rowid = ?", [(rowid,) for rowid in rowids])
+    rows = list(decoded_polygons(conn.execute(
+        POLYGON_ROWS + " WHERE rowid IN (SELECT value FROM json_each(?))", (json.dumps(rowids),)
+    )))
+    index_extents(conn, rows)
+    index_polygon_lods(conn, [(rowid, polygon) for rowid, polygon, _, _ in rows], simplify)
+
+
+def delete_outage_rows(conn, rowids):
+    """Delete outages rows together with their extents and polygon levels of detail."""
+    params = [(rowid,) for rowid in rowids]
+    conn.executemany("DELETE FROM outages WHERE rowid = ?", params)
+    conn.executemany("DELETE FROM outage_extents WHERE id = ?", params)
+    conn.executemany("DELETE FROM polygon_lods WHERE outage_rowid = ?", params)
+
+
+def parse_timestamp(value):
+    """An aware datetime of an ISO timestamp; scrapers that store naive timestamps use UTC."""
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def timestamp_epoch(api_call_timestamp):
+    """Unix seconds of an ISO timestamp, read as parse_timestamp does."""
+    return int(parse_timestamp(api_call_timestamp).timestamp())
+
+
+def payload_json(value):
+    """Compact JSON text of an API payload, with non-ASCII characters kept as they are."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def customer_count(value, default=0):
+    """A numCustomersOut value as an int, or `default` when it is missing or not a number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def rollup_snapshot(conn, company_name, api_call_timestamp, outage_count, customers_out, max_outage):
+    """
+    Fold one snapshot's totals into the rollups of its company, its province and the
+    country. Each bucket keeps the peak values seen within it. A province or the
+    country is the sum of each of its companies' latest snapshot as of this one,
+    read from the manifest, which must already list this snapshot.
+    """
+    entries = [("company", company_name, customers_out, outage_count, max_outage)]
+    province = COMPANY_PROVINCES.get(company_name)
+    regions = {NATIONAL: [0, 0, 0]}
+    if province is not None:
+        regions[province] = [0, 0, 0]
+    for company, row_count, company_customers, company_max in conn.execute(
+        _SNAPSHOT_TOTALS_AS_OF, (api_call_timestamp,)
+    ):
+        for region in (NATIONAL, COMPANY_PROVINCES.get(company)):
+            if region in regions:
+                totals = regions[region]
+                totals[0] += company_customers or 0
+                totals[1] += row_count
+                totals[2] = max(totals[2], company_max or 0)
+    for region, (region_customers, region_count, region_max) in regions.items():
+        scope = "national" if region == NATIONAL else "province"
+        entries.append((scope, region, region_customers, region_count, region_max))
+
+    epoch = timestamp_epoch(api_call_timestamp)
+    conn.executemany(
+        """
+        INSERT INTO outage_rollups (scope, name, resolution, bucket, customersOut, outageCount, maxOutage)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (scope, name, resolution, bucket) DO UPDATE SET
+            customersOut = MAX(customersOut, excluded.customersOut),
+            outageCount = MAX(outageCount, excluded.outageCount),
+            maxOutage = MAX(maxOutage, excluded.maxOutage)
+        """,
+        [
+            (scope, name, resolution, epoch - epoch % resolution, customers, count, largest)
+            for scope, name, customers, count, largest in entries
+            for resolution in ROLLUP_RESOLUTIONS.values()
+        ],
+    )
+
+
+def create_schema(conn):
+    """Create the tables and indexes of SCHEMA that don't exist yet, in the caller's transaction."""
+    statement = ""
+    for line in SCHEMA.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+
+
+def check_schema(conn):
+    """
+    Create the schema in a new, empty database; otherwise make sure the database is at
+    SCHEMA_VERSION. Older databases are only upgraded by migrate.py, as their backfills
+    take far longer than a writer should hold the lock for. Raises RuntimeError for those.
+    """
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version == 0:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read again under the write lock: another writer may have just created the schema
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            (objects,) = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            if version == 0 and not objects:
+                create_schema(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                version = SCHEMA_VERSION
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Outages database is at schema version {version}, expected {SCHEMA_VERSION}; run migrate.py"
+        )
+
+
+def connect(db_file=DB_FILE):
+    """Open the outages database for writing; see check_schema."""
+    conn = sqlite3.connect(db_file)
+    # WAL lets the API's read-only connections keep reading while a scraper commits
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        check_schema(conn)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+# Type affinity of each OUTAGE_COLUMNS column in SCHEMA; polygon is handled by canonical_row
+COLUMN_AFFINITIES = (
+    "TEXT", "TEXT", "TEXT", "TEXT", "INTEGER",
+    "TEXT", "REAL", "REAL",
+    "TEXT", "TEXT", None, "TEXT", "INTEGER", "TEXT",
+)
+
+
+_NUMERIC_TEXT = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+
+def _number(value):
+    """A numeric string as an int or float, like SQLite's numeric affinity; None if it isn't one."""
+    if not _NUMERIC_TEXT.fullmatch(value):
+        return None
+    number = float(value)
+    if number.is_integer() and abs(number) < 2 ** 63:
+        return int(value) if value.lstrip("+-").isdigit() else int(number)
+    return number
+
+
+def stored_value(value, affinity):
+    """
+    The value SQLite will hand back after storing `value` in a column of this affinity,
+    so rows a scraper built (int ids, numeric strings) compare equal to stored ones.
+    """
+    if value is None or isinstance(value, bytes):
+        return value
+    if affinity == "TEXT":
+        if isinstance(value, float):
+            return repr(value)
+        return str(int(value)) if isinstance(value, bool) else str(value)
+    if affinity in ("INTEGER", "REAL"):
+        if isinstance(value, str):
+            number = _number(value.strip())
+            if number is None:
+                return value
+            value = number
+        if affinity == "REAL" and isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+            return int(value)
+    return value
+
+
+def canonical_row(row):
+    """
+    Convert a scraper's row in OUTAGE_COLUMNS order to STORED_COLUMNS order, with its
+    values coerced to their stored types and its polygon (JSON text or a list) moved
+    into the canonical geometry columns.
+    """
+    row = tuple(stored_value(value, affinity) for value, affinity in zip(row, COLUMN_AFFINITIES))
+    try:
+        encoded, layout = geometry.encode_polygon(row[10])
+    except (ValueError, TypeError, IndexError):
+        # Keep what the scraper gave; readers still parse polygon JSON
+        return row + (None, None)
+    return row[:10] + (None,) + row[11:] + (encoded, layout)
+
+
+def row_to_outage(row, encoded=False, fields=None):
+    """
+    Convert a row in SNAPSHOT_OUTAGES_COLUMNS (or STORED_COLUMNS) order to the API shape.
+    With `encoded`, the polygon's encoded polyline is passed through as "geometry"
+    instead of being decoded into a "polygon" list. `fields` (a set of OUTAGE_FIELDS)
+    keeps only those keys; the polygon isn't decoded unless it's one of them.
+    """
+    outage = {
+        "id": row[0],
+        "municipality": row[1],
+        "area": row[2],
+        "cause": row[3],
+        "num_customers": row[4],
+        "crew_status": row[5],
+        "latitude": row[6],
+        "longitude": row[7],
+        "date_off": row[8],
+        "crew_eta": row[9],
+    }
+    if fields is None or "polygon" in fields:
+        if encoded:
+            outage["geometry"] = row[14]
+        else:
+            outage["polygon"] = geometry.stored_polygon(row[10], row[14], row[15])
+    outage["power_company"] = row[11]
+    outage["planned"] = row[12]
+    outage["time_stamp"] = row[13]
+    if fields is not None:
+        outage = {key: value for key, value in outage.items() if key in fields or key == "geometry"}
+    return outage
+
+
+def record_changes(conn, company_name, rows, api_call_timestamp):
+    """
+    Diff a new batch against the company's previous snapshot by outage id and append
+    the added, updated and removed outages to the outage_changes log.
+    """
+    previous_timestamp = conn.execute(
+        "SELECT MAX(apiCallTimestamp) FROM snapshots WHERE company = ? AND apiCallTimestamp < ?",
+        (company_name, api_call_timestamp),
+    ).fetchone()[0]
+    previous = {}
+    if previous_timestamp is not None:
+        columns = ", ".join(STORED_COLUMNS)
+        for row in conn.execute(
+            f"SELECT {columns} FROM outages WHERE company = ? AND apiCallTimestamp = ?",
+            (company_name, previous_timestamp),
+        ):
+            previous[row[0]] = row
+
+    changes = []
+    current_ids = set()
+    for row in rows:
+        outage_id = row[0]
+        current_ids.add(outage_id)
+        # Compare everything but apiCallTimestamp, which differs on every run
+        before = previous.get(outage_id)
+        if before is not None and _same_outage(before, row):
+            continue
+        change = "added" if before is None else "updated"
+        changes.append((company_name, outage_id, change, api_call_timestamp, payload_json(row_to_outage(row))))
+    for outage_id in previous.keys() - current_ids:
+        changes.append((company_name, outage_id, "removed", api_call_timestamp, None))
+    conn.executemany(
+        "INSERT INTO outage_changes (company, outageId, change, apiCallTimestamp, outage) VALUES (?, ?, ?, ?, ?)",
+        changes,
+    )
+
+
+def _same_outage(before, row):
+    """
+    True when two STORED_COLUMNS rows differ at most in apiCallTimestamp. New rows must
+    have been through canonical_row, so their values have the types SQLite hands back.
+    """
+    return tuple(before[:13]) + tuple(before[14:]) == tuple(row[:13]) + tuple(row[14:])
+
+
+def store_intervals(conn, company_name, rows, api_call_timestamp, simplify=geometry.simplify_polygon):
+    """
+    Interval-mode write of one snapshot's canonical rows. Outages that didn't change only
+    get their timestamps moved forward; changed and new ones are written to outages and
+    start a new version in outage_intervals; outages no longer listed are deleted from
+    outages, their last version ending at the previous snapshot.
+    """
+    previous_timestamp, previous_intervals = conn.execute(
+        """
+        SELECT apiCallTimestamp, intervals FROM snapshots
+        WHERE company = ? AND apiCallTimestamp < ?
+        ORDER BY apiCallTimestamp DESC LIMIT 1
+        """,
+        (company_name, api_call_timestamp),
+    ).fetchone() or (None, 0)
+    previous = {}
+    if previous_intervals:
+        # Rows of a snapshot stored in snapshot mode stay behind as its history
+        for rowid, *row in conn.execute(
+            f"SELECT rowid, {', '.join(STORED_COLUMNS)} FROM outages WHERE company = ? AND apiCallTimestamp = ?",
+            (company_name, previous_timestamp),
+        ):
+            previous.setdefault(row[0], []).append((rowid, row))
+
+    placeholders = ", ".join("?" for _ in STORED_COLUMNS)
+    assignments = ", ".join(f"{column} = ?" for column in STORED_COLUMNS)
+    unchanged, reindex, versions = [], [], []
+    for row in rows:
+        matches = previous.get(row[0])
+        if matches:
+            rowid, before = matches.pop(0)
+            if _same_outage(before, row):
+                unchanged.append(rowid)
+                continue
+            conn.execute(f"UPDATE outages SET {assignments} WHERE rowid = ?", row + (rowid,))
+        else:
+            rowid = conn.execute(
+                f"INSERT INTO outages ({', '.join(STORED_COLUMNS)}) VALUES ({placeholders})", row
+            ).lastrowid
+        reindex.append(rowid)
+        versions.append(row[:13] + (api_call_timestamp,) + row[14:] + (api_call_timestamp, rowid))
+
+    conn.executemany(
+        "UPDATE outages SET apiCallTimestamp = ? WHERE rowid = ?",
+        [(api_call_timestamp, rowid) for rowid in unchanged],
+    )
+    conn.executemany(
+        "UPDATE outage_intervals SET lastSeen = ? WHERE outageRowid = ? AND lastSeen = ?",
+        [(api_call_timestamp, rowid, previous_timestamp) for rowid in unchanged],
+    )
+    delete_outage_rows(conn, [rowid for matches in previous.values() for rowid, _ in matches])
+    index_outage_rows(conn, reindex, simplify)
+
+    insert_version = (
+        f"INSERT INTO outage_intervals ({', '.join(INTERVAL_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in INTERVAL_COLUMNS)})"
+    )
+    interval_rowids = [conn.execute(insert_version, version).lastrowid for version in versions]
+    index_extents(conn, [
+        (interval_rowid, geometry.stored_polygon(version[10], version[14], version[15]), version[6], version[7])
+        for interval_rowid, version in zip(interval_rowids, versions)
+    ], table="interval_extents")
+
+
+def store_snapshot(conn, company_name, rows, api_call_timestamp, mode=None, simplify=geometry.simplify_polygon):
+    """
+    Insert one scraper run's rows and record it in the snapshots manifest.
+
+    Each row is a tuple in OUTAGE_COLUMNS order, stored as its canonical_row. The rows,
+    their extents, simplified polygons and changelog entries, the manifest entry and
+    the rollups are committed together, so a reader never sees a manifest entry
+    without its rows. `mode` overrides STORAGE_MODE, and `simplify` is passed on to
+    index_polygon_lods.
+    """
+    mode = mode or STORAGE_MODE
+    rows = [canonical_row(row) for row in rows]
+    customers = [customer_count(row[4]) for row in rows]
+    placeholders = ", ".join("?" for _ in STORED_COLUMNS)
+    with conn:
+        record_changes(conn, company_name, rows, api_call_timestamp)
+        if mode == "intervals":
+            store_intervals(conn, company_name, rows, api_call_timestamp, simplify)
+        else:
+            # Current rows left by an interval-mode run are superseded; their history is in outage_intervals
+            delete_outage_rows(conn, [rowid for (rowid,) in conn.execute(
+                """
+                SELECT o.rowid FROM outages o
+                JOIN snapshots s ON s.company = o.company AND s.apiCallTimestamp = o.apiCallTimestamp
+                WHERE o.company = ? AND s.intervals
+                """,
+                (company_name,),
+            ).fetchall()])
+            conn.executemany(
+                f"INSERT OR REPLACE INTO outages ({', '.join(STORED_COLUMNS)}) VALUES ({placeholders})",
+                rows,
+            )
+            index_snapshot(conn, company_name, api_call_timestamp, simplify)
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO snapshots
+                (company, apiCallTimestamp, rowCount, customersOut, maxOutage, intervals)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                company_name, api_call_timestamp, len(rows), sum(customers), max(customers, default=0),
+                int(mode == "intervals"),
+            ),
+        )
+        rollup_snapshot(
+            conn, company_name, api_call_timestamp, len(rows), sum(customers), max(customers, default=0)
+        )
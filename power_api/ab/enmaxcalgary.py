@@ -1,7 +1,11 @@
 import requests
-import sqlite3
 from datetime import datetime, timezone
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
 COMPANY_NAME = "ENMAX Calgary"
@@ -38,8 +42,8 @@ def fetch_calgary_outages():
 
 def store_outages(outages, company_name):
     """Store outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
@@ -57,34 +61,25 @@ def store_outages(outages, company_name):
         crew_eta = outage.get("estimatedRestoration", "Unknown")
         is_planned = outage.get("isPlanned", False)
 
-        # Insert the outage into the database
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                incident_id,
-                municipality,
-                "N/A",  # Area is not provided explicitly
-                cause,
-                num_customers,
-                outage.get("status", "N/A"),  # Use the status field for crew status
-                latitude,
-                longitude,
-                date_off,
-                crew_eta,
-                json.dumps([]),  # No polygon data available, so store an empty list
-                company_name,
-                int(is_planned),  # Convert boolean to int for database storage
-                api_call_timestamp,
-            ),
-        )
+        # Queue the outage for the snapshot insert
+        rows.append((
+            incident_id,
+            municipality,
+            "N/A",  # Area is not provided explicitly
+            cause,
+            num_customers,
+            outage.get("status", "N/A"),  # Use the status field for crew status
+            latitude,
+            longitude,
+            date_off,
+            crew_eta,
+            json.dumps([]),  # No polygon data available, so store an empty list
+            company_name,
+            int(is_planned),  # Convert boolean to int for database storage
+            api_call_timestamp,
+        ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -1,10 +1,15 @@
 import requests
-import sqlite3
 import json
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Database configuration
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
+COMPANY_NAME = "Equs Alberta"
 
 # Define the URL for the detailed outage information
 url_outages = "https://ems2.equs.ca:7576/data/outages.json"
@@ -63,22 +68,16 @@ def fetch_outages():
         }, indent=4))
         return []
 
-def store_outages(outages, company_name="Equs Alberta"):
+def store_outages(outages, company_name=COMPANY_NAME):
     """Store processed outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     # Get the current timestamp
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage["id"],
             "N/A",  # Municipality not provided
             "N/A",  # Area not provided
@@ -95,7 +94,7 @@ def store_outages(outages, company_name="Equs Alberta"):
             api_call_timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -2,6 +2,11 @@ import requests
 import sqlite3
 import json
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Path to your SQLite database
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
@@ -48,20 +53,14 @@ def fetch_outages():
 
 def store_outages(outages, company_name):
     """Store fetched outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     # Get the current timestamp
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage.get("id"),
             outage.get("municipality", "N/A"),
             outage.get("area", "N/A"),
@@ -74,10 +73,11 @@ def store_outages(outages, company_name):
             outage.get("crewEta", "Unknown"),
             json.dumps(outage.get("polygon", [])),
             company_name,
+            0,  # BC Hydro does not flag planned outages
             api_call_timestamp  # Save the timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -1,10 +1,15 @@
 import json
-import sqlite3
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
+COMPANY_NAME = "FortisBC"
 
 def fetch_outage_data():
     """Fetch and parse FortisBC outage data."""
@@ -58,10 +63,10 @@ def parse_coordinates(coord_list):
             print(f"Skipping malformed coordinates in list: {coord_list}")
     return coordinates
 
-def store_outages(outages, company_name="FortisBC"):
+def store_outages(outages, company_name=COMPANY_NAME):
     """Store fetched outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     # Get the current timestamp
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
@@ -69,13 +74,7 @@ def store_outages(outages, company_name="FortisBC"):
     for outage in outages:
         coordinates = parse_coordinates(outage['coordinates_list'])
 
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage['serial'],
             outage['description'] or "N/A",
             outage['notes'] or "N/A",
@@ -92,7 +91,7 @@ def store_outages(outages, company_name="FortisBC"):
             api_call_timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
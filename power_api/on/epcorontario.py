@@ -1,7 +1,11 @@
 import requests
 import json
-import sqlite3
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Database configuration
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
@@ -63,18 +67,12 @@ def fetch_outages():
 
 # Function to store outages in the database
 def store_outages(outages, company_name):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage["id"],                   # id
             "N/A",                          # municipality
             "N/A",                          # area
@@ -91,7 +89,7 @@ def store_outages(outages, company_name):
             api_call_timestamp              # apiCallTimestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -2,6 +2,10 @@ import os
 import json
 import aiohttp
 import asyncio
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Base URL components
 BASE_URL = "https://kubra.io/cluster-data"
@@ -129,7 +133,6 @@ async def fetch_all_tiles():
     print(f"\nGlobal outage data saved to {GLOBAL_OUTAGE_FILE}")
 
 import json
-import sqlite3
 from datetime import datetime
 
 # Database configuration
@@ -148,8 +151,8 @@ def store_in_db():
         outages = json.load(f)
 
     # Connect to the database
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     api_call_timestamp = datetime.utcnow().isoformat()
 
@@ -160,13 +163,7 @@ def store_in_db():
             polygon = geom_list[0] if geom_list else []
             latitude, longitude = polygon[0][1], polygon[0][0] if polygon else (0.0, 0.0)
 
-            cursor.execute("""
-                INSERT OR IGNORE INTO outages (
-                    id, municipality, area, cause, numCustomersOut,
-                    crewStatusDescription, latitude, longitude,
-                    dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            rows.append((
                 outage.get("id", "Unknown"),
                 "Unknown",  # Municipality placeholder
                 "Unknown",  # Area placeholder
@@ -186,7 +183,7 @@ def store_in_db():
             print(f"Error storing outage {outage.get('id', 'Unknown')}: {e}")
 
     # Commit changes and close the database connection
-    conn.commit()
+    outage_store.store_snapshot(conn, COMPANY_NAME, rows, api_call_timestamp)
     conn.close()
     print("All outages stored in the database.")
 
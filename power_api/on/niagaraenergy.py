@@ -1,8 +1,12 @@
 import requests
 import xml.etree.ElementTree as ET
 import json
-import sqlite3
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Constants
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
@@ -78,20 +82,14 @@ def fetch_outages():
 
 def store_outages(outages, company_name):
     """Store fetched outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     # Get the current timestamp
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage["id"],
             outage["municipality"],
             outage["area"],
@@ -108,7 +106,7 @@ def store_outages(outages, company_name):
             api_call_timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -4,8 +4,12 @@ import requests
 import re
 import json
 import polyline
-import sqlite3
 from datetime import datetime, timezone
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
 COMPANY_NAME = "Hydro Ottawa"
@@ -62,8 +66,8 @@ def fetch_and_combine_json_content(url):
 
 def store_outages(outages, company_name):
     """Store fetched outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
@@ -81,13 +85,7 @@ def store_outages(outages, company_name):
                 polygon = []
 
         # Insert data into the database
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage.get("id", "Unknown"),
             "Unknown",  # Municipality placeholder
             "Unknown",  # Area placeholder
@@ -104,7 +102,7 @@ def store_outages(outages, company_name):
             api_call_timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, company_name, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {company_name}.")
 
@@ -4,6 +4,11 @@ import json
 from datetime import datetime, timezone
 import pytz
 from math import radians, cos, sin, sqrt, atan2
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import outage_store
 
 # Path to your SQLite database
 DB_FILE = "/root/ohub/ohub-db/ohub-db/outages_db"
@@ -144,19 +149,13 @@ def process_outages_and_polygons(outage_data, polygon_data):
 
 def store_outages(outages):
     """Store processed outage data in the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = outage_store.connect(DB_FILE)
+    rows = []
 
     api_call_timestamp = datetime.now(timezone.utc).isoformat()
 
     for outage in outages:
-        cursor.execute("""
-            INSERT INTO outages (
-                id, municipality, area, cause, numCustomersOut,
-                crewStatusDescription, latitude, longitude,
-                dateOff, crewEta, polygon, company, planned, apiCallTimestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        rows.append((
             outage.get("id", "Unknown"),
             outage.get("municipality", "N/A"),
             outage.get("area", "N/A"),
@@ -173,7 +172,7 @@ def store_outages(outages):
             api_call_timestamp
         ))
 
-    conn.commit()
+    outage_store.store_snapshot(conn, COMPANY_NAME, rows, api_call_timestamp)
     conn.close()
     print(f"Inserted {len(outages)} outage records for {COMPANY_NAME}.")
 
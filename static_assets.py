@@ -0,0 +1,150 @@
+"""
+In-memory serving of the frontend's static files.
+
+Every asset is read once, precompressed for each supported content-encoding and
+served from memory. Each asset also gets a fingerprinted URL (/static/<name>.<hash>.<ext>)
+that can be cached forever, since new content means a new URL; HTML pages have their
+references to the other assets rewritten to those URLs. A periodic stat of the files
+reloads whatever changed on disk.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip and identity are always served
+    brotli = None
+
+STATIC_PREFIX = "/static/"
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Unfingerprinted URLs (pages and the legacy asset paths) are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def compressed_payloads(content, gzip_level=9, brotli_quality=11):
+    """{content-encoding: body} of `content` for identity, gzip and, when available, brotli."""
+    payloads = {"identity": content, "gzip": gzip.compress(content, compresslevel=gzip_level)}
+    if brotli is not None:
+        payloads["br"] = brotli.compress(content, quality=brotli_quality)
+    return payloads
+
+
+class Asset:
+    """One loaded file: its encoded bodies, fingerprint and the stat it was loaded from."""
+
+    def __init__(self, name, path, content, stat):
+        self.name = name
+        self.path = path
+        self.stat = stat
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        digest = hashlib.sha256(content).hexdigest()
+        # Weak, since the same validator covers every content-encoding of the body
+        self.etag = f'W/"{digest[:FINGERPRINT_LENGTH]}"'
+        stem, extension = os.path.splitext(name)
+        self.url = f"{STATIC_PREFIX}{stem}.{digest[:FINGERPRINT_LENGTH]}{extension}"
+        if self.content_type.startswith(COMPRESSIBLE_TYPES):
+            self.payloads = compressed_payloads(content)
+        else:
+            self.payloads = {"identity": content}
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class AssetStore:
+    """
+    The frontend files, keyed by name. Pages (HTML files) are loaded after the other
+    assets so their references to them can point at the fingerprinted URLs.
+    """
+
+    def __init__(self, files):
+        self.files = dict(files)  # {name: path on disk}
+        self._assets = {}
+        self._by_url = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """The current Asset for a name, or None when its file couldn't be loaded."""
+        return self._assets.get(name)
+
+    def by_url(self, url):
+        """The Asset served at a fingerprinted URL (current or previous version), or None."""
+        return self._by_url.get(url)
+
+    def _rewrite_references(self, content, assets):
+        text = content.decode("utf-8")
+        for name, asset in assets.items():
+            if asset.content_type.startswith("text/html"):
+                continue
+            # Matches "styles.css", "/styles.css" and "./styles.css" inside quotes
+            pattern = r"""(["'])(?:\.?/)?""" + re.escape(name) + r"""(["'?#])"""
+            text = re.sub(pattern, lambda match: match.group(1) + asset.url + match.group(2), text)
+        return text.encode("utf-8")
+
+    def reload(self):
+        """
+        Load every file whose stat changed since it was last loaded. Meant to run on a
+        worker thread; requests keep getting the previous assets until it finishes.
+        Returns the names that were (re)loaded.
+        """
+        with self._lock:
+            assets = dict(self._assets)
+            changed = []
+            pages = [name for name in self.files if mimetypes.guess_type(name)[0] == "text/html"]
+            for name, path in self.files.items():
+                if name in pages:
+                    continue
+                stat = _file_stat(path)
+                current = assets.get(name)
+                if current is not None and current.stat == stat:
+                    continue
+                if stat is None:
+                    if assets.pop(name, None) is not None:
+                        changed.append(name)
+                    continue
+                try:
+                    with open(path, "rb") as asset_file:
+                        assets[name] = Asset(name, path, asset_file.read(), stat)
+                except OSError as e:
+                    print(f"Error loading static asset {path}: {e}")
+                    continue
+                changed.append(name)
+            assets_changed = bool(changed)
+            for name in pages:
+                path = self.files[name]
+                stat = _file_stat(path)
+                current = assets.get(name)
+                # Pages are rebuilt when they or any asset they may reference changed
+                if current is not None and current.stat == stat and not assets_changed:
+                    continue
+                if stat is None:
+                    if assets.pop(name, None) is not None:
+                        changed.append(name)
+                    continue
+                try:
+                    with open(path, "rb") as page_file:
+                        content = self._rewrite_references(page_file.read(), assets)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Error loading static asset {path}: {e}")
+                    continue
+                assets[name] = Asset(name, path, content, stat)
+                changed.append(name)
+            if changed:
+                # The previous version stays reachable until the next change, for pages loaded just before this one
+                previous = {asset.url: asset for asset in self._assets.values()}
+                self._assets = assets
+                self._by_url = {**previous, **{asset.url: asset for asset in assets.values()}}
+            return changed
@@ -0,0 +1,58 @@
+"""
+Headline outage totals for the /summary endpoint.
+
+Each company's totals are computed once when its snapshot is loaded into the cache;
+the national and provincial totals are then just sums over the dozen companies, so a
+refresh only does work proportional to the companies that changed.
+"""
+import outage_store
+
+UNKNOWN_PROVINCE = "unknown"
+
+
+def _empty_totals():
+    return {
+        "outages": 0,
+        "customers_out": 0,
+        "planned": {"outages": 0, "customers_out": 0},
+        "unplanned": {"outages": 0, "customers_out": 0},
+    }
+
+
+def _add(totals, other):
+    totals["outages"] += other["outages"]
+    totals["customers_out"] += other["customers_out"]
+    for kind in ("planned", "unplanned"):
+        totals[kind]["outages"] += other[kind]["outages"]
+        totals[kind]["customers_out"] += other[kind]["customers_out"]
+
+
+def company_totals(rows):
+    """Outage count and customers out of one company's cached outages, split by planned."""
+    totals = _empty_totals()
+    for outage in rows:
+        customers = outage_store.customer_count(outage.get("num_customers"))
+        kind = totals["planned"] if outage.get("planned") else totals["unplanned"]
+        totals["outages"] += 1
+        totals["customers_out"] += customers
+        kind["outages"] += 1
+        kind["customers_out"] += customers
+    return totals
+
+
+def build_summary(totals_by_company, watermarks):
+    """
+    Combine per-company totals (from company_totals) into national, provincial and
+    per-company sections. Returns the summary encoded as compact JSON.
+    """
+    national = _empty_totals()
+    provinces = {}
+    companies = {}
+    for company in sorted(totals_by_company):
+        totals = totals_by_company[company]
+        province = outage_store.COMPANY_PROVINCES.get(company, UNKNOWN_PROVINCE)
+        _add(national, totals)
+        _add(provinces.setdefault(province, _empty_totals()), totals)
+        companies[company] = {**totals, "province": province, "time_stamp": watermarks.get(company)}
+    summary = {"national": national, "provinces": provinces, "companies": companies}
+    return outage_store.payload_json(summary).encode("utf-8")
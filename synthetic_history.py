@@ -0,0 +1,324 @@
+"""
+Synthetic outage history at production scale, and a benchmark of the historical queries on it.
+
+`generate` grows an outages database to a target number of rows by simulating
+5-minute scraper runs of every company in outages_cache.json, continuing after the
+latest snapshot of a database that already has history. Each company keeps
+about as many outages active as it has in the cache: new ones are cloned from its
+cached outages (cause, customers, and coordinates and polygon shifted a little), their
+customer counts drop as crews restore power, and they end after a few hours. Storms
+hit a province a few times a month and multiply the rate of unplanned outages there
+for hours at a time. Runs go through outage_store.store_snapshot, so the manifest,
+extents, simplified polygons, changelog and rollups are all built as they would be
+in production.
+
+`bench` times the queries the API runs against such a database: the latest snapshot,
+the refresh watermarks, as-of lookups at random points of the history, changelog
+pages and rollups, and saves the results like benchmark.py does. benchmark.py --db
+also load-tests the HTTP endpoints on a generated database.
+
+    python3 synthetic_history.py generate --rows 10000000 --db history.db [--mode intervals]
+    python3 synthetic_history.py bench --db history.db [--samples 200] [--output results.json]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import time
+
+import benchmark
+import db
+import geometry
+import outage_store
+
+INTERVAL = timedelta(minutes=5)
+DEFAULT_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+MEAN_LIFETIME_STEPS = 36  # Runs an outage stays active on average (3 hours)
+RESTORE_PROBABILITY = 0.1  # Chance per run that crews restore some of an outage's customers
+POSITION_JITTER = 0.05  # Degrees a cloned outage is moved from its cached original
+STORMS_PER_MONTH = 3  # Per province
+STORM_STEPS = (72, 432)  # A storm lasts 6 to 36 hours
+STORM_MULTIPLIER = (4.0, 15.0)  # Rate of new unplanned outages during a storm
+STEPS_PER_MONTH = 30 * 24 * 12
+
+PROGRESS_INTERVAL = 288  # Runs between progress lines (one simulated day)
+SIMPLIFY_CACHE_SIZE = 100000  # Simplified polygons remembered while generating
+
+
+def _poisson(rng, mean):
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    # Knuth's method, fine for the small means of one company's arrivals per run
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+class CompanySimulation:
+    """The active outages of one company, advanced one scraper run at a time."""
+
+    def __init__(self, company, templates, rng, id_prefix=""):
+        self.company = company
+        self.id_prefix = id_prefix  # Keeps ids apart from those of an earlier generate run
+        self.templates = templates
+        self.unplanned = [outage for outage in templates if not outage["planned"]] or templates
+        self.rng = rng
+        # New outages per run that keep about len(templates) active at once
+        self.arrival_rate = len(templates) / MEAN_LIFETIME_STEPS
+        self.active = []
+        self.created = 0
+
+    def _clone(self, template, api_call_timestamp):
+        rng = self.rng
+        d_lon = rng.uniform(-POSITION_JITTER, POSITION_JITTER)
+        d_lat = rng.uniform(-POSITION_JITTER, POSITION_JITTER)
+        points = geometry.polygon_points(template["polygon"])
+        self.created += 1
+        return {
+            **template,
+            "id": f"{template['id']}-{self.id_prefix}{self.created}",
+            "latitude": None if template["latitude"] is None else template["latitude"] + d_lat,
+            "longitude": None if template["longitude"] is None else template["longitude"] + d_lon,
+            "polygon": [[lon + d_lon, lat + d_lat] for lon, lat in points] if points else [],
+            "num_customers": max(1, int(max(1, outage_store.customer_count(template["num_customers"], 1)) * rng.lognormvariate(0, 1))),
+            "date_off": api_call_timestamp,
+        }
+
+    def step(self, api_call_timestamp, storm_multiplier):
+        """Advance one run; returns its rows in OUTAGE_COLUMNS order."""
+        rng = self.rng
+        active = []
+        for outage in self.active:
+            if rng.random() < 1 / MEAN_LIFETIME_STEPS:
+                continue
+            if rng.random() < RESTORE_PROBABILITY:
+                outage["num_customers"] = max(1, int(outage["num_customers"] * rng.uniform(0.5, 1)))
+            active.append(outage)
+        for _ in range(_poisson(rng, self.arrival_rate)):
+            active.append(self._clone(rng.choice(self.templates), api_call_timestamp))
+        # Storms only add unplanned outages
+        for _ in range(_poisson(rng, self.arrival_rate * (storm_multiplier - 1))):
+            active.append(self._clone(rng.choice(self.unplanned), api_call_timestamp))
+        self.active = active
+        return [benchmark.outage_row(outage, api_call_timestamp) for outage in active]
+
+
+def _memoized_simplify(simplify):
+    """
+    store_snapshot re-simplifies an outage's polygon on every run it stays active, as it
+    does for the scrapers. That dominates generation time, so generate passes it this,
+    which remembers the result per polygon; the stored levels of detail are the same.
+    """
+    cache = {}
+
+    def simplify_polygon(polygon, tolerance):
+        key = (json.dumps(polygon), tolerance)
+        if key not in cache:
+            if len(cache) >= SIMPLIFY_CACHE_SIZE:
+                cache.clear()
+            cache[key] = simplify(polygon, tolerance)
+        return cache[key]
+
+    return simplify_polygon
+
+
+def _resume_point(conn):
+    """The latest snapshot's time (None for an empty database) and the rows stored so far."""
+    latest, rows = conn.execute("SELECT MAX(apiCallTimestamp), COALESCE(SUM(rowCount), 0) FROM snapshots").fetchone()
+    if latest is None:
+        return None, rows
+    return outage_store.parse_timestamp(latest), rows
+
+
+def generate(db_file, target_rows, start=DEFAULT_START, mode=None, seed=0):
+    """
+    Simulate scraper runs from `start` until the database holds target_rows outage rows
+    (counted as in the manifest, so each is a new outages row in snapshot mode). A database
+    with history continues one run after its latest snapshot, if that is later than `start`.
+    Returns the number of runs simulated.
+    """
+    conn = outage_store.connect(db_file)
+    latest, written = _resume_point(conn)
+    if latest is not None:
+        start = max(start, latest + INTERVAL)
+        print(f"{db_file} already holds {written} rows up to {latest.isoformat()}; continuing from {start.isoformat()}")
+    # Seeded by the start too, so a resumed run doesn't replay the first one's outages
+    rng = random.Random(f"{seed}:{start.isoformat()}")
+    id_prefix = f"{outage_store.timestamp_epoch(start.isoformat())}-" if latest is not None else ""
+    companies = benchmark.load_cached_outages()
+    simulations = [
+        CompanySimulation(company, templates, rng, id_prefix) for company, templates in sorted(companies.items())
+    ]
+    # Warm up so the history starts at the steady state rather than from zero outages
+    for _ in range(MEAN_LIFETIME_STEPS * 3):
+        for simulation in simulations:
+            simulation.step(start.isoformat(), 1.0)
+
+    provinces = sorted({outage_store.COMPANY_PROVINCES.get(company) for company in companies} - {None})
+    storms = {}  # {province: (last storm run, multiplier)}
+    # A generated database can be regenerated, so durability is traded for speed
+    conn.execute("PRAGMA synchronous = OFF")
+    simplify = _memoized_simplify(geometry.simplify_polygon)
+    step, started, resumed_rows = 0, time.monotonic(), written
+    try:
+        while written < target_rows:
+            api_call_timestamp = (start + INTERVAL * step).isoformat()
+            for province in provinces:
+                if province in storms and storms[province][0] < step:
+                    del storms[province]
+                if province not in storms and rng.random() < STORMS_PER_MONTH / STEPS_PER_MONTH:
+                    storms[province] = (step + rng.randint(*STORM_STEPS), rng.uniform(*STORM_MULTIPLIER))
+            for simulation in simulations:
+                storm = storms.get(outage_store.COMPANY_PROVINCES.get(simulation.company))
+                rows = simulation.step(api_call_timestamp, storm[1] if storm else 1.0)
+                outage_store.store_snapshot(conn, simulation.company, rows, api_call_timestamp, mode, simplify)
+                written += len(rows)
+            step += 1
+            if step % PROGRESS_INTERVAL == 0:
+                elapsed = time.monotonic() - started
+                print(
+                    f"{api_call_timestamp}: {written} rows, {step} runs, "
+                    f"{(written - resumed_rows) / elapsed:.0f} rows/s, "
+                    f"storms in {', '.join(sorted(storms)) or 'no province'}"
+                )
+    finally:
+        conn.close()
+    return step
+
+
+def _history_range(db_file):
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        first, last = conn.execute("SELECT MIN(apiCallTimestamp), MAX(apiCallTimestamp) FROM snapshots").fetchone()
+        (rows,) = conn.execute("SELECT COUNT(*) FROM outages").fetchone()
+        (snapshots,) = conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()
+        (changes,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM outage_changes").fetchone()
+    finally:
+        conn.close()
+    if first is None:
+        raise ValueError(f"{db_file} has no snapshots")
+    return first, last, rows, snapshots, changes
+
+
+async def _time_query(samples, query):
+    """Run `query` (a coroutine function of the sample index) `samples` times."""
+    durations = []
+    for sample in range(samples):
+        started = time.perf_counter()
+        await query(sample)
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return {
+        "samples": samples,
+        "p50_ms": round(benchmark.percentile(durations, 50) * 1000, 2),
+        "p95_ms": round(benchmark.percentile(durations, 95) * 1000, 2),
+        "p99_ms": round(benchmark.percentile(durations, 99) * 1000, 2),
+        "mean_ms": round(sum(durations) / samples * 1000, 2),
+    }
+
+
+async def _bench(db_file, samples, seed):
+    rng = random.Random(seed)
+    first, last, _, _, changes = _history_range(db_file)
+    first_epoch, last_epoch = outage_store.timestamp_epoch(first), outage_store.timestamp_epoch(last)
+
+    def random_epoch():
+        return rng.uniform(first_epoch, last_epoch)
+
+    def random_timestamp():
+        return datetime.fromtimestamp(random_epoch(), timezone.utc).isoformat()
+
+    def window(days):
+        end = int(random_epoch())
+        return end - days * 86400, end
+
+    companies = sorted(outage_store.COMPANY_PROVINCES)
+    queries = {
+        "latest": lambda _: db.latest_outages(),
+        "latest-encoded": lambda _: db.latest_outages(encoded=True),
+        "watermarks": lambda _: db.snapshot_watermarks(),
+        "as-of": lambda _: db.outages_as_of(random_timestamp()),
+        "as-of-points": lambda _: db.outages_as_of(
+            random_timestamp(), filters=db.OutageFilter(fields=frozenset({"id", "latitude", "longitude"}))
+        ),
+        "changes": lambda _: db.outage_changes(rng.randint(0, max(0, changes - 1000)), 1000),
+        "rollups-national-day-5m": lambda _: db.rollups("national", outage_store.NATIONAL, 300, *window(1)),
+        "rollups-province-month-1h": lambda _: db.rollups("province", "ON", 3600, *window(30)),
+        "rollups-company-all-1d": lambda _: db.rollups(
+            "company", rng.choice(companies), 86400, int(first_epoch), int(last_epoch)
+        ),
+    }
+    db.open_pool(db_file)
+    try:
+        results = {}
+        for name, query in queries.items():
+            results[name] = await _time_query(samples, query)
+            print(
+                f"{name:<26} p50={results[name]['p50_ms']}ms p95={results[name]['p95_ms']}ms "
+                f"p99={results[name]['p99_ms']}ms"
+            )
+        return results
+    finally:
+        db.close_pool()
+
+
+def bench(db_file, samples=100, seed=0):
+    """Time the API's historical queries on db_file. Returns a report for the results file."""
+    first, last, rows, snapshots, _ = _history_range(db_file)
+    print(f"{db_file}: {rows} outage rows, {snapshots} snapshots from {first} to {last}")
+    started = datetime.now(timezone.utc)
+    results = asyncio.run(_bench(db_file, samples, seed))
+    return {
+        "started": started.isoformat(),
+        "commit": benchmark.git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "db": db_file,
+        "db_bytes": os.path.getsize(db_file),
+        "outage_rows": rows,
+        "snapshots": snapshots,
+        "history": [first, last],
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic outage history or benchmark queries on it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="Grow an outages database by simulated scraper runs")
+    generate_parser.add_argument("--db", required=True)
+    generate_parser.add_argument(
+        "--rows", type=int, required=True, help="Outage rows the database should hold, e.g. 10000000"
+    )
+    generate_parser.add_argument(
+        "--start", default=DEFAULT_START.isoformat(), help="ISO time of the first run, if after the latest snapshot"
+    )
+    generate_parser.add_argument("--mode", choices=("snapshots", "intervals"), help="Storage mode to write in")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    bench_parser = commands.add_parser("bench", help="Time the historical queries on a database")
+    bench_parser.add_argument("--db", required=True)
+    bench_parser.add_argument("--samples", type=int, default=100, help="Runs of each query")
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.add_argument("--output", help="Results file (default history-benchmark-<UTC time>.json)")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        start = outage_store.parse_timestamp(args.start)
+        runs = generate(args.db, args.rows, start, args.mode, args.seed)
+        print(f"Simulated {runs} runs per company into {args.db}")
+    else:
+        report = bench(args.db, args.samples, args.seed)
+        output = args.output or f"history-benchmark-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results saved to {output}")
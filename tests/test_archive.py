@@ -0,0 +1,74 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import archive
+import db
+import outage_store
+from test_db import outage_row
+
+SNAPSHOTS = ("2024-11-10T10:00:00", "2024-11-20T10:00:00", "2024-12-05T10:00:00", "2025-01-02T10:00:00")
+AS_OF = ("2024-11-15T00:00:00", "2024-12-31T00:00:00", "2025-01-10T00:00:00")
+
+
+def history(path):
+    conn = outage_store.connect(path)
+    for day, timestamp in enumerate(SNAPSHOTS):
+        for company, lat, lon in (("NB Power", 45.96, -66.64), ("Quebec Hydro", 45.5, -73.56)):
+            rows = [
+                outage_row(company, f"{company[0]}{day}-{i}", lat + i / 10, lon, customers=day + i)[:13] + (timestamp,)
+                for i in range(3)
+            ]
+            outage_store.store_snapshot(conn, company, rows, timestamp)
+    conn.close()
+
+
+def as_of_outages(path, bbox=None):
+    async def main():
+        db.open_pool(path)
+        try:
+            return [await db.outages_as_of(timestamp, bbox) for timestamp in AS_OF]
+        finally:
+            db.close_pool()
+    return asyncio.run(main())
+
+
+def test_archived_months_still_answer_as_of_queries(tmp_path):
+    path = str(tmp_path / "outages.db")
+    history(path)
+    before = as_of_outages(path)
+    in_bbox = as_of_outages(path, (-67.0, 45.0, -66.0, 46.1))
+
+    moved = archive.archive_partitions(path, datetime(2025, 1, 15, tzinfo=timezone.utc))
+    assert moved == {"2024-11": 12, "2024-12": 6}
+    for month in moved:
+        assert os.stat(archive.partition_path(path, month)).st_mode & 0o777 == 0o444
+
+    assert as_of_outages(path) == before
+    assert as_of_outages(path, (-67.0, 45.0, -66.0, 46.1)) == in_bbox
+    assert [{row["time_stamp"] for row in outages} for outages in before] == [
+        {SNAPSHOTS[0]}, {SNAPSHOTS[2]}, {SNAPSHOTS[3]},
+    ]
+    assert [len(outages) for outages in in_bbox] == [2, 2, 2]
+
+    conn = outage_store.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM outages").fetchone() == (6,)
+    assert conn.execute("SELECT partitionMonth, COUNT(*) FROM snapshots GROUP BY 1 ORDER BY 1").fetchall() == [
+        (None, 2), ("2024-11", 4), ("2024-12", 2),
+    ]
+    # Nothing left to move; a repeated run changes nothing
+    assert archive.archive_partitions(path, datetime(2025, 1, 15, tzinfo=timezone.utc)) == {}
+
+
+def test_prune_changes_keeps_recent_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "PRUNE_BATCH_SIZE", 4)
+    path = str(tmp_path / "outages.db")
+    history(path)
+    conn = outage_store.connect(path)
+    # The first snapshot adds 3 outages per company; each later one removes those and adds 3 more
+    assert conn.execute("SELECT COUNT(*) FROM outage_changes").fetchone() == (6 + 3 * 12,)
+
+    # Retention reaches back to 2024-12-02, before the December snapshot
+    assert archive.prune_changes(path, datetime(2025, 1, 2, tzinfo=timezone.utc)) == 6 + 12
+    kept = conn.execute("SELECT DISTINCT apiCallTimestamp FROM outage_changes").fetchall()
+    assert kept == [(SNAPSHOTS[2],), (SNAPSHOTS[3],)]
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import broadcast
+
+
+def outage(outage_id, customers, time_stamp="2025-01-01T10:00:00"):
+    return {"id": outage_id, "num_customers": customers, "power_company": "NB Power", "time_stamp": time_stamp}
+
+
+def parse_event(message):
+    fields = dict(line.split(": ", 1) for line in message.decode("utf-8").strip().split("\n"))
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+def test_diff_ignores_time_stamps():
+    old = [outage("a", 10), outage("b", 20), outage("c", 30)]
+    new = [outage("a", 10, "2025-01-01T10:05:00"), outage("b", 25, "2025-01-01T10:05:00"), outage("d", 5)]
+    upserts, removed = broadcast.diff_outages(old, new)
+    assert [row["id"] for row in upserts] == ["b", "d"]
+    assert removed == ["c"]
+
+
+def test_stream_resyncs_unless_the_client_is_current():
+    async def first_messages(broadcaster, last_event_id):
+        stream = broadcaster.stream(last_event_id)
+        messages = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return messages
+
+    async def main():
+        broadcaster = broadcast.Broadcaster()
+        broadcaster.publish([outage("a", 10)], [])
+        fresh = await first_messages(broadcaster, None)
+        stale = await first_messages(broadcaster, "0")
+        # A current client goes straight to the next diff
+        stream = broadcaster.stream("1")
+        assert await stream.__anext__() == b"retry: 5000\n\n"
+        next_message = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        broadcaster.publish([], ["a"])
+        current = await next_message
+        await stream.aclose()
+        return fresh, stale, current, len(broadcaster)
+
+    fresh, stale, current, subscribers = asyncio.run(main())
+    assert parse_event(fresh[1]) == ("1", "resync", {})
+    assert parse_event(stale[1]) == ("1", "resync", {})
+    assert parse_event(current) == ("2", "outages", {"upserts": [], "removed": ["a"]})
+    assert subscribers == 0
+
+
+def test_full_queues_are_replaced_by_a_resync():
+    async def main():
+        broadcaster = broadcast.Broadcaster(queue_size=2)
+        queue = broadcaster.subscribe()
+        for customers in (1, 2, 3):
+            broadcaster.publish([outage("a", customers)], [])
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert [parse_event(message)[:2] for message in asyncio.run(main())] == [("3", "resync")]
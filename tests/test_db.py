@@ -0,0 +1,114 @@
+import asyncio
+import math
+
+import pytest
+
+import db
+import outage_store
+
+TIMESTAMP = "2025-01-01T10:00:00"
+NB_BBOX = (-67.0, 45.0, -66.0, 46.5)
+
+
+def outage_row(company, outage_id, lat, lon, customers=10, points=3, radius=0.01):
+    # Quebec Hydro style [[lat, lon], ...] pairs around (lat, lon)
+    ring = [
+        [round(lat + radius * math.sin(2 * math.pi * i / points), 5),
+         round(lon + radius * math.cos(2 * math.pi * i / points), 5)]
+        for i in range(points)
+    ]
+    return (
+        outage_id, "Town", "Area", "Storm", customers, "Assigned", lat, lon,
+        TIMESTAMP, None, ring, company, 0, TIMESTAMP,
+    )
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "outages.db")
+    conn = outage_store.connect(path)
+    outage_store.store_snapshot(conn, "NB Power", [
+        outage_row("NB Power", "n1", 45.96, -66.64),
+        outage_row("NB Power", "n2", 46.1, -66.5, customers=300, points=40, radius=0.05),
+        outage_row("NB Power", "n3", 47.5, -65.6),
+    ], TIMESTAMP)
+    outage_store.store_snapshot(conn, "Quebec Hydro", [
+        outage_row("Quebec Hydro", "q1", 45.5, -73.56),
+        outage_row("Quebec Hydro", "q2", 46.8, -71.2),
+    ], TIMESTAMP)
+    conn.close()
+    return path
+
+
+def run(path, query):
+    async def main():
+        db.open_pool(path)
+        try:
+            return await query()
+        finally:
+            db.close_pool()
+    return asyncio.run(main())
+
+
+def test_pages_follow_the_cursor_through_every_outage(db_path):
+    async def query():
+        everything = await db.latest_outages()
+        pages, after = [], None
+        while True:
+            filters = db.OutageFilter(after=after, limit=2)
+            page, after = await db.outages_page(None, None, 0, False, filters)
+            pages.append([outage["id"] for outage in page])
+            if after is None:
+                return everything, pages
+
+    everything, pages = run(db_path, query)
+    assert pages == [["n1", "n2"], ["n3", "q1"], ["q2"]]
+    assert [outage["id"] for outage in everything] == ["n1", "n2", "n3", "q1", "q2"]
+
+
+def test_streams_read_one_page_per_query(db_path, monkeypatch):
+    monkeypatch.setattr(db, "STREAM_PAGE_SIZE", 2)
+
+    async def query():
+        return [[outage["id"] for outage in page] async for page in db.iter_outages()]
+
+    assert run(db_path, query) == [["n1", "n2"], ["n3", "q1"], ["q2"]]
+
+
+def test_filters_narrow_and_project_the_rows(db_path):
+    async def query():
+        filters = db.OutageFilter(companies=("NB Power",), min_customers=100, fields=frozenset({"id"}))
+        return await db.latest_outages(filters=filters)
+
+    assert run(db_path, query) == [{"id": "n2"}]
+
+
+def test_bbox_selects_intersecting_outages(db_path):
+    async def query():
+        return await db.latest_outages(bbox=NB_BBOX)
+
+    assert [outage["id"] for outage in run(db_path, query)] == ["n1", "n2"]
+
+
+def test_detail_levels_fall_back_to_the_original_polygon(db_path):
+    async def query():
+        return {level: await db.latest_outages(bbox=NB_BBOX, detail=level) for level in (0, 1, 3)}
+
+    levels = run(db_path, query)
+    original = {outage["id"]: outage["polygon"] for outage in levels[0]}
+    assert len(original["n2"]) == 40
+    coarse = {outage["id"]: outage["polygon"] for outage in levels[3]}
+    assert 3 <= len(coarse["n2"]) < 40
+    # Too few points to simplify, or nothing dropped at the finest level: the original is served
+    assert coarse["n1"] == original["n1"]
+    assert {outage["id"]: outage["polygon"] for outage in levels[1]} == original
+
+
+def test_company_snapshot_reads_every_level_at_one_watermark(db_path):
+    async def query():
+        return await db.company_snapshot("NB Power", (3,))
+
+    timestamp, levels = run(db_path, query)
+    assert timestamp == TIMESTAMP
+    assert [outage["id"] for outage in levels[0]] == [outage["id"] for outage in levels[3]] == ["n1", "n2", "n3"]
+    assert len(levels[3][1]["polygon"]) < len(levels[0][1]["polygon"])
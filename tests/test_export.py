@@ -0,0 +1,31 @@
+import pytest
+
+import outage_store
+from test_outage_store import scraper_row
+
+pq = pytest.importorskip("pyarrow.parquet")
+import export  # noqa: E402
+
+
+def test_export_rebuilds_interval_mode_snapshots(tmp_path):
+    path = str(tmp_path / "outages.db")
+    conn = outage_store.connect(path)
+    outage_store.store_snapshot(conn, "BC Hydro", [scraper_row(1, "2025-01-01T10:00:00")], "2025-01-01T10:00:00")
+    for timestamp in ("2025-01-01T10:05:00", "2025-01-01T10:10:00"):
+        rows = [scraper_row(1, timestamp), scraper_row(2, timestamp, customers=40)]
+        outage_store.store_snapshot(conn, "BC Hydro", rows, timestamp, mode="intervals")
+    conn.close()
+
+    output = str(tmp_path / "outages.parquet")
+    assert export.export_outages(path, output, "2025-01-01", "2025-01-02") == 5
+    table = pq.read_table(output)
+    exported = sorted(
+        (row["apiCallTimestamp"].isoformat(), row["id"], row["numCustomersOut"]) for row in table.to_pylist()
+    )
+    assert exported == [
+        ("2025-01-01T10:00:00+00:00", "1", 12),
+        ("2025-01-01T10:05:00+00:00", "1", 12),
+        ("2025-01-01T10:05:00+00:00", "2", 40),
+        ("2025-01-01T10:10:00+00:00", "1", 12),
+        ("2025-01-01T10:10:00+00:00", "2", 40),
+    ]
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import geometry
+
+# One ring in each shape a scraper hands over, keyed by the layout code it is stored with
+RINGS = {
+    geometry.LAYOUT_FLAT_LON_LAT: [-66.64321, 45.96345, -66.64, 45.97, -66.65, 45.97123],
+    geometry.LAYOUT_FLAT_LAT_LON: [45.96345, -66.64321, 45.97, -66.64, 45.97123, -66.65],
+    geometry.LAYOUT_PAIRS_LON_LAT: [[-73.56789, 45.50123], [-73.56, 45.51], [-73.57, 45.51]],
+    geometry.LAYOUT_PAIRS_LAT_LON: [[45.50123, -73.56789], [45.51, -73.56], [45.51, -73.57]],
+}
+
+
+@pytest.mark.parametrize("layout", sorted(RINGS))
+def test_polygons_round_trip_in_their_layout(layout):
+    encoded, stored_layout = geometry.encode_polygon(RINGS[layout])
+    assert stored_layout == layout
+    assert geometry.decode_polygon(encoded, stored_layout) == RINGS[layout]
+    # JSON text, as older rows hold it, encodes the same way
+    assert geometry.encode_polygon(json.dumps(RINGS[layout])) == (encoded, layout)
+
+
+def test_polylines_round_trip_at_five_decimal_places():
+    points = [(45.123456, -66.654321), (45.0, -66.0), (-0.00001, 0.00001)]
+    decoded = geometry.decode_polyline(geometry.encode_polyline(points))
+    assert decoded == [(45.12346, -66.65432), (45.0, -66.0), (-0.00001, 0.00001)]
+
+
+def test_empty_polygons_have_no_encoding():
+    for polygon in ([], "[]", '"[]"', None):
+        assert geometry.encode_polygon(polygon) == (None, None)
+    assert geometry.stored_polygon(None, None, None) == []
+
+
+def test_simplify_keeps_the_layout():
+    square = [[45.0, -66.0], [45.0, -65.99999], [45.0, -65.5], [45.5, -65.5], [45.5, -66.0]]
+    simplified = geometry.simplify_polygon(square, 0.001)
+    assert simplified == [[45.0, -66.0], [45.0, -65.5], [45.5, -65.5], [45.5, -66.0]]
+    assert geometry.simplify_polygon(square[:3], 0.001) is None
+
+
+def test_bbox_parsing_and_intersection():
+    bbox = geometry.parse_bbox("-67,45,-66,46")
+    assert bbox == (-67.0, 45.0, -66.0, 46.0)
+    assert geometry.extents_intersect(geometry.outage_extent(RINGS[0], None, None), bbox)
+    assert not geometry.extents_intersect(geometry.outage_extent(RINGS[2], None, None), bbox)
+    assert geometry.outage_extent([], 45.5, -66.5) == (-66.5, 45.5, -66.5, 45.5)
+    for value in ("-67,45,-66", "-66,45,-67,46", "a,b,c,d"):
+        with pytest.raises(ValueError):
+            geometry.parse_bbox(value)
+
+
+def test_detail_for_zoom():
+    assert [geometry.detail_for_zoom(zoom) for zoom in (3, 6, 9, 12, 18)] == [3, 2, 1, 0, 0]
@@ -0,0 +1,75 @@
+import json
+import sqlite3
+
+import pytest
+
+import migrate
+import outage_store
+
+POLYGON = [[-120.3, 50.6], [-120.3, 50.7], [-120.4, 50.7]]
+
+
+def legacy_database(path):
+    # An outages table from before the canonical geometry columns, manifest and indexes
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE outages (id TEXT, municipality TEXT, area TEXT, cause TEXT, numCustomersOut INTEGER,"
+        " crewStatusDescription TEXT, latitude REAL, longitude REAL, dateOff TEXT, crewEta TEXT, polygon TEXT,"
+        " company TEXT, planned INTEGER DEFAULT 0, apiCallTimestamp TEXT)"
+    )
+    for timestamp, customers in (("2025-01-01T10:00:00", 12), ("2025-01-01T10:05:00", 30)):
+        conn.execute(
+            "INSERT INTO outages (id, numCustomersOut, latitude, longitude, polygon, company, apiCallTimestamp)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("101", customers, 50.65, -120.35, json.dumps(POLYGON), "BC Hydro", timestamp),
+        )
+    conn.commit()
+    conn.close()
+
+
+def test_connect_refuses_legacy_database_until_migrated(tmp_path):
+    path = str(tmp_path / "outages.db")
+    legacy_database(path)
+    with pytest.raises(RuntimeError, match="migrate.py"):
+        outage_store.connect(path)
+
+    steps = migrate.migrate(path, make_backup=False)
+    assert steps == ["encode_polygons", "extents", "manifest", "polygon_lods", "rollups"]
+    assert migrate.migrate(path, make_backup=False) == []
+
+    conn = outage_store.connect(path)
+    rows = conn.execute("SELECT polygon, geometry, polygonLayout FROM outages").fetchall()
+    assert all(polygon is None and geometry for polygon, geometry, _ in rows)
+    assert outage_store.geometry.decode_polygon(rows[0][1], rows[0][2]) == POLYGON
+    assert conn.execute("SELECT company, apiCallTimestamp, rowCount, customersOut FROM snapshots").fetchall() == [
+        ("BC Hydro", "2025-01-01T10:00:00", 1, 12),
+        ("BC Hydro", "2025-01-01T10:05:00", 1, 30),
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM outage_extents").fetchone()[0] == 2
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'schema_migrations'").fetchone() is None
+
+
+def test_interrupted_migration_resumes_pending_backfills(tmp_path, monkeypatch):
+    path = str(tmp_path / "outages.db")
+    legacy_database(path)
+
+    def fail(conn):
+        raise KeyboardInterrupt
+
+    monkeypatch.setitem(migrate.BACKFILLS, "manifest", fail)
+    with pytest.raises(KeyboardInterrupt):
+        migrate.migrate(path, make_backup=False)
+    monkeypatch.undo()
+
+    assert migrate.migrate(path, make_backup=False) == ["manifest", "polygon_lods", "rollups"]
+    outage_store.connect(path).close()
+
+
+def test_backup_copies_the_database(tmp_path):
+    path = str(tmp_path / "outages.db")
+    legacy_database(path)
+    migrate.migrate(path)
+    (backup,) = tmp_path.glob("outages.db.backup-*")
+    conn = sqlite3.connect(backup)
+    assert conn.execute("SELECT polygon FROM outages").fetchone()[0] == json.dumps(POLYGON)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
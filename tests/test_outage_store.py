@@ -0,0 +1,100 @@
+import outage_store
+
+
+def scraper_row(outage_id, timestamp, customers=12):
+    # Like bchydro.py and epcorontario.py: an int id and a numeric string count
+    return (
+        outage_id, "Kamloops", "Area 1", "Tree contact", str(customers),
+        "Crew assigned", 50.67, -120.33, "2025-01-01T10:00:00", None,
+        [[50.6, -120.3], [50.7, -120.3], [50.7, -120.4]], "BC Hydro", 0, timestamp,
+    )
+
+
+def test_identical_runs_with_int_ids_log_no_updates(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    for timestamp in ("2025-01-01T10:00:00", "2025-01-01T10:05:00", "2025-01-01T10:10:00"):
+        outage_store.store_snapshot(conn, "BC Hydro", [scraper_row(101, timestamp)], timestamp)
+    changes = conn.execute("SELECT outageId, change FROM outage_changes ORDER BY rowid").fetchall()
+    assert changes == [("101", "added")]
+
+
+def test_identical_interval_runs_with_int_ids_keep_one_interval(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    for timestamp in ("2025-01-01T10:00:00", "2025-01-01T10:05:00"):
+        outage_store.store_snapshot(conn, "BC Hydro", [scraper_row(101, timestamp)], timestamp, mode="intervals")
+    intervals = conn.execute("SELECT id, firstSeen, lastSeen FROM outage_intervals").fetchall()
+    assert intervals == [("101", "2025-01-01T10:00:00", "2025-01-01T10:05:00")]
+    assert conn.execute("SELECT COUNT(*) FROM outages").fetchone()[0] == 1
+
+
+def test_company_provinces_follow_the_scraper_directories(tmp_path):
+    (tmp_path / "nb").mkdir()
+    (tmp_path / "nb" / "saintjohn.py").write_text('import requests\n\nCOMPANY_NAME = "Saint John Energy"\n')
+    (tmp_path / "nb" / "helpers.py").write_text("def fetch():\n    COMPANY_NAME = 'not module level'\n")
+    assert outage_store.scraper_provinces(str(tmp_path)) == {"Saint John Energy": "NB"}
+    assert outage_store.COMPANY_PROVINCES["Equs Alberta"] == "AB"
+    assert outage_store.COMPANY_PROVINCES["Hydro Ottawa"] == "ON"
+
+
+def test_min_customers_treats_text_counts_as_zero(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    timestamp = "2025-01-01T10:00:00"
+    rows = [scraper_row(101, timestamp, "Unknown"), scraper_row(102, timestamp, "<5"), scraper_row(103, timestamp, 40)]
+    outage_store.store_snapshot(conn, "BC Hydro", rows, timestamp)
+    assert conn.execute("SELECT typeof(numCustomersOut) FROM outages WHERE id = '101'").fetchone() == ("text",)
+    query = outage_store.outages_query(min_customers=True)
+    matched = conn.execute(query, outage_store.filter_params(min_customers=10)).fetchall()
+    assert [row[0] for row in matched] == ["103"]
+
+
+def test_stored_polygons_come_back_in_their_source_layout(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    timestamp = "2025-01-01T10:00:00"
+    polygons = [
+        [-66.64321, 45.96345, -66.64, 45.97, -66.65, 45.97123],
+        [45.96345, -66.64321, 45.97, -66.64, 45.97123, -66.65],
+        [[-66.64321, 45.96345], [-66.64, 45.97], [-66.65, 45.97123]],
+        [[45.96345, -66.64321], [45.97, -66.64], [45.97123, -66.65]],
+    ]
+    rows = [scraper_row(layout, timestamp)[:10] + (polygon,) + scraper_row(layout, timestamp)[11:]
+            for layout, polygon in enumerate(polygons)]
+    outage_store.store_snapshot(conn, "BC Hydro", rows, timestamp)
+    stored = conn.execute("SELECT polygon, polygonLayout FROM outages ORDER BY rowid").fetchall()
+    assert stored == [(None, 0), (None, 1), (None, 2), (None, 3)]
+    outages = [outage_store.row_to_outage(row) for row in conn.execute(outage_store.outages_query())]
+    assert [outage["polygon"] for outage in outages] == polygons
+
+
+def test_as_of_reads_snapshot_and_interval_mode_history(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    outage_store.store_snapshot(conn, "BC Hydro", [scraper_row(1, "2025-01-01T10:00:00")], "2025-01-01T10:00:00")
+    for timestamp, customers in (("2025-01-01T10:05:00", 12), ("2025-01-01T10:10:00", 50), ("2025-01-01T10:15:00", 50)):
+        rows = [scraper_row(1, timestamp, customers), scraper_row(2, timestamp)]
+        outage_store.store_snapshot(conn, "BC Hydro", rows, timestamp, mode="intervals")
+
+    def as_of(timestamp):
+        params = (timestamp,) + outage_store.filter_params() * 2
+        return [
+            (outage["id"], outage["num_customers"], outage["time_stamp"])
+            for outage in map(outage_store.row_to_outage, conn.execute(outage_store.outages_query(as_of=True), params))
+        ]
+
+    assert as_of("2025-01-01T10:02:00") == [("1", 12, "2025-01-01T10:00:00")]
+    assert as_of("2025-01-01T10:07:00") == [("1", 12, "2025-01-01T10:05:00"), ("2", 12, "2025-01-01T10:05:00")]
+    # An interval stands for every snapshot it spans, stamped with the one asked about
+    assert as_of("2025-01-01T10:20:00") == [("1", 50, "2025-01-01T10:15:00"), ("2", 12, "2025-01-01T10:15:00")]
+
+
+def test_changes_log_updates_and_removals(tmp_path):
+    conn = outage_store.connect(str(tmp_path / "outages.db"))
+    runs = (
+        ("2025-01-01T10:00:00", [scraper_row(1, "2025-01-01T10:00:00"), scraper_row(2, "2025-01-01T10:00:00")]),
+        ("2025-01-01T10:05:00", [scraper_row(1, "2025-01-01T10:05:00", 40)]),
+    )
+    for timestamp, rows in runs:
+        outage_store.store_snapshot(conn, "BC Hydro", rows, timestamp)
+    changes = conn.execute(outage_store.OUTAGE_CHANGES_QUERY, (1, 10)).fetchall()
+    assert [(offset, outage_id, change) for offset, _, outage_id, change, _, _ in changes] == [
+        (2, "2", "added"), (3, "1", "updated"), (4, "2", "removed"),
+    ]
+    assert '"num_customers":40' in changes[1][5] and changes[2][5] is None
@@ -0,0 +1,63 @@
+import pytest
+
+import clusters
+import geometry
+import vector_tiles
+
+mapbox_vector_tile = pytest.importorskip("mapbox_vector_tile")
+
+ZOOM = 10
+POLYGON_OUTAGE = {
+    "id": "n1", "power_company": "NB Power", "num_customers": 120, "planned": False, "cause": None,
+    "polygon": [-66.70, 45.90, -66.60, 45.90, -66.60, 46.00, -66.70, 46.00],
+}
+POINT_OUTAGE = {
+    "id": "n2", "power_company": "NB Power", "num_customers": -1, "planned": True, "cause": "Storm",
+    "polygon": [], "latitude": 45.95, "longitude": -66.65,
+}
+
+
+def tile_of(lon, lat, zoom=ZOOM):
+    scale = 2 ** zoom
+    return zoom, int(clusters.mercator_x(lon) * scale), int(clusters.mercator_y(lat) * scale)
+
+
+def tile_set(outages):
+    extents = [geometry.outage_extent(o["polygon"], o.get("latitude"), o.get("longitude")) for o in outages]
+    return vector_tiles.TileSet(outages, extents)
+
+
+def decode(tile):
+    return mapbox_vector_tile.decode(tile, default_options={"y_coord_down": True})["outages"]
+
+
+def test_tiles_encode_polygons_and_points_with_their_properties():
+    tiles = tile_set([POLYGON_OUTAGE, POINT_OUTAGE])
+    layer = decode(tiles.tile(*tile_of(-66.65, 45.95)))
+    assert layer["extent"] == vector_tiles.EXTENT
+    polygon, point = layer["features"]
+    assert polygon["properties"] == {"id": "n1", "power_company": "NB Power", "num_customers": 120, "planned": False}
+    assert polygon["geometry"]["type"] == "Polygon"
+    ring = polygon["geometry"]["coordinates"][0]
+    assert len(ring) >= 4
+    low, high = -vector_tiles.BUFFER, vector_tiles.EXTENT + vector_tiles.BUFFER
+    assert all(low <= x <= high and low <= y <= high for x, y in ring)
+    assert point["properties"] == {
+        "id": "n2", "power_company": "NB Power", "num_customers": -1, "planned": True, "cause": "Storm",
+    }
+    assert point["geometry"]["type"] == "Point"
+
+
+def test_polygons_crossing_tiles_are_clipped_to_the_buffer():
+    # At zoom 14 the outage spans several tiles; each only gets its buffered share
+    tiles = tile_set([POLYGON_OUTAGE])
+    (feature,) = decode(tiles.tile(*tile_of(-66.65, 45.95, 14)))["features"]
+    ring = feature["geometry"]["coordinates"][0]
+    assert {x for x, _ in ring} <= {-vector_tiles.BUFFER, vector_tiles.EXTENT + vector_tiles.BUFFER}
+
+
+def test_empty_tiles_and_the_tile_cache():
+    tiles = tile_set([POLYGON_OUTAGE])
+    assert tiles.tile(*tile_of(-123.1, 49.3)) == b""
+    key = tile_of(-66.65, 45.95)
+    assert tiles.tile(*key) is tiles.tile(*key)
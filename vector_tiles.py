@@ -0,0 +1,221 @@
+"""
+Mapbox Vector Tile encoding of the cached outages for /tiles/{z}/{x}/{y}.mvt.
+
+A TileSet is built from each cache snapshot: outage geometries are projected to
+Web Mercator once, then every requested tile clips and quantizes them to the tile
+extent and encodes the result as a protobuf MVT. Encoded tiles are kept in a
+per-snapshot LRU, so replacing the TileSet on refresh invalidates all of them.
+
+The protobuf encoding is written out by hand; MVT only needs varints and
+length-delimited fields, which keeps this free of extra dependencies.
+"""
+from collections import OrderedDict
+import struct
+import threading
+
+import clusters
+import geometry
+
+LAYER_NAME = "outages"
+EXTENT = 4096
+BUFFER = 64  # Tile units kept around each edge so polygons join up across tiles
+MAX_ZOOM = 22
+CACHE_SIZE = 1024
+
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POINT, POLYGON = 1, 3
+
+FEATURE_PROPERTIES = ("id", "power_company", "num_customers", "planned", "cause")
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b"".join(_varint(value) for value in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _encode_value(value):
+    """Encode a property value as an MVT Value message."""
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        return _varint_field(6, _zigzag(value)) if value < 0 else _varint_field(5, value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def _clip_polygon(ring, low, high):
+    """Sutherland-Hodgman clip of a ring against the square [low, high] on both axes."""
+    for axis, bound, keep_above in ((0, low, True), (0, high, False), (1, low, True), (1, high, False)):
+        if not ring:
+            return ring
+        clipped = []
+        previous = ring[-1]
+        for point in ring:
+            point_in = point[axis] >= bound if keep_above else point[axis] <= bound
+            previous_in = previous[axis] >= bound if keep_above else previous[axis] <= bound
+            if point_in != previous_in:
+                t = (bound - previous[axis]) / (point[axis] - previous[axis])
+                crossing = [previous[0] + t * (point[0] - previous[0]), previous[1] + t * (point[1] - previous[1])]
+                crossing[axis] = bound
+                clipped.append(tuple(crossing))
+            if point_in:
+                clipped.append(point)
+            previous = point
+        ring = clipped
+    return ring
+
+
+def _polygon_geometry(ring):
+    """Encode a quantized ring as MVT polygon commands, exterior ring oriented clockwise."""
+    area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))
+    if area < 0:
+        ring = ring[::-1]
+    commands = [_command(MOVE_TO, 1), _zigzag(ring[0][0]), _zigzag(ring[0][1]), _command(LINE_TO, len(ring) - 1)]
+    cursor_x, cursor_y = ring[0]
+    for x, y in ring[1:]:
+        commands.append(_zigzag(x - cursor_x))
+        commands.append(_zigzag(y - cursor_y))
+        cursor_x, cursor_y = x, y
+    commands.append(_command(CLOSE_PATH, 1))
+    return commands
+
+
+def _quantize(ring):
+    """Round a ring to integer tile units, dropping consecutive duplicates and the closing point."""
+    points = []
+    for x, y in ring:
+        point = (int(round(x)), int(round(y)))
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+class TileSet:
+    """Vector tiles for one snapshot of the cached outages, encoded on demand and LRU-cached."""
+
+    def __init__(self, data, extents, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        # (mercator bounds, mercator ring or None for points, properties) per outage
+        self._features = []
+        for outage, extent in zip(data, extents):
+            if not extent:
+                continue
+            try:
+                points = geometry.polygon_points(outage["polygon"])
+            except (ValueError, TypeError, IndexError):
+                points = []
+            if len(points) >= 3:
+                ring = [(clusters.mercator_x(lon), clusters.mercator_y(lat)) for lon, lat in points]
+            else:
+                ring = [(
+                    clusters.mercator_x((extent[0] + extent[2]) / 2),
+                    clusters.mercator_y((extent[1] + extent[3]) / 2),
+                )]
+            xs = [x for x, _ in ring]
+            ys = [y for _, y in ring]
+            properties = {
+                name: outage[name] for name in FEATURE_PROPERTIES if outage.get(name) is not None
+            }
+            self._features.append(((min(xs), min(ys), max(xs), max(ys)), ring, properties))
+
+    def tile(self, z, x, y):
+        """The encoded tile at z/x/y, from the LRU when it was requested before."""
+        key = (z, x, y)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        encoded = self._encode(z, x, y)
+        with self._lock:
+            self._tiles[key] = encoded
+            if len(self._tiles) > self.cache_size:
+                self._tiles.popitem(last=False)
+        return encoded
+
+    def _encode(self, z, x, y):
+        scale = 2 ** z
+        margin = BUFFER / EXTENT / scale
+        tile_min_x, tile_min_y = x / scale - margin, y / scale - margin
+        tile_max_x, tile_max_y = (x + 1) / scale + margin, (y + 1) / scale + margin
+
+        keys, key_index = [], {}
+        values, value_index = [], {}
+        features = []
+        for (min_x, min_y, max_x, max_y), ring, properties in self._features:
+            if max_x < tile_min_x or min_x > tile_max_x or max_y < tile_min_y or min_y > tile_max_y:
+                continue
+            local = [((px * scale - x) * EXTENT, (py * scale - y) * EXTENT) for px, py in ring]
+            if len(local) >= 3:
+                quantized = _quantize(_clip_polygon(local, -BUFFER, EXTENT + BUFFER))
+                if len(quantized) >= 3:
+                    geom_type, commands = POLYGON, _polygon_geometry(quantized)
+                else:
+                    # Polygons smaller than a tile unit are drawn as points
+                    cx = sum(px for px, _ in local) / len(local)
+                    cy = sum(py for _, py in local) / len(local)
+                    geom_type, commands = POINT, [_command(MOVE_TO, 1), _zigzag(int(round(cx))), _zigzag(int(round(cy)))]
+            else:
+                px, py = local[0]
+                geom_type, commands = POINT, [_command(MOVE_TO, 1), _zigzag(int(round(px))), _zigzag(int(round(py)))]
+
+            tags = []
+            for name, value in properties.items():
+                if name not in key_index:
+                    key_index[name] = len(keys)
+                    keys.append(name)
+                value_key = (type(value).__name__, value)
+                if value_key not in value_index:
+                    value_index[value_key] = len(values)
+                    values.append(value)
+                tags.extend((key_index[name], value_index[value_key]))
+            features.append(
+                _packed_field(2, tags) + _varint_field(3, geom_type) + _packed_field(4, commands)
+            )
+
+        if not features:
+            return b""
+        layer = (
+            _varint_field(15, 2)
+            + _bytes_field(1, LAYER_NAME.encode("utf-8"))
+            + b"".join(_bytes_field(2, feature) for feature in features)
+            + b"".join(_bytes_field(3, key.encode("utf-8")) for key in keys)
+            + b"".join(_bytes_field(4, _encode_value(value)) for value in values)
+            + _varint_field(5, EXTENT)
+        )
+        return _bytes_field(3, layer)
@@ -0,0 +1,123 @@
+"""
+Spatial join of the weather alerts written by weather_api/main.py with the cached outages.
+
+The alert polygons are loaded into an STRtree of prepared geometries whenever the
+alerts file changes or one of its alerts expires, and every cache refresh runs the
+outages through it once, so each outage knows the alerts covering it and each alert
+the outages under it. shapely is optional; without it no join is made.
+"""
+from datetime import datetime, timezone
+import json
+
+try:
+    from shapely import STRtree
+    from shapely.errors import GEOSException
+    from shapely.geometry import Point, Polygon
+    from shapely.prepared import prep
+except ImportError:  # the alert join is the only feature that needs shapely
+    STRtree = None
+
+import geometry
+import outage_store
+
+# weather_api/main.py gives alerts it found no polygon for this one instead, which isn't their area
+PLACEHOLDER_RING = [[-100.0, 50.0], [-99.0, 50.0], [-99.0, 49.0], [-100.0, 49.0], [-100.0, 50.0]]
+
+
+def _expiry(alert):
+    try:
+        return outage_store.parse_timestamp(alert["expiry"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AlertIndex:
+    """
+    The rings of every unexpired alert in an STRtree, with a prepared geometry per ring.
+    `next_expiry` is when the first of those alerts expires, after which the index is stale.
+    """
+
+    def __init__(self, alerts, now=None):
+        now = now or datetime.now(timezone.utc)
+        self.alert_ids = set()
+        self.next_expiry = None
+        self._ids = []  # Alert id of each ring
+        rings = []
+        for alert in alerts:
+            expiry = _expiry(alert)
+            if expiry is not None:
+                if expiry <= now:
+                    continue
+                self.next_expiry = min(self.next_expiry or expiry, expiry)
+            self.alert_ids.add(alert["id"])
+            # Multipolygons arrive flattened into a list of rings; each is matched on its own
+            for ring in alert.get("polygon") or []:
+                if len(ring) < 3 or ring == PLACEHOLDER_RING:
+                    continue
+                polygon = Polygon(ring)
+                if not polygon.is_valid:
+                    polygon = polygon.buffer(0)
+                rings.append(polygon)
+                self._ids.append(alert["id"])
+        self._tree = STRtree(rings)
+        self._prepared = [prep(ring) for ring in rings]
+
+    def expired(self, now=None):
+        """True once one of the indexed alerts has expired."""
+        return self.next_expiry is not None and self.next_expiry <= (now or datetime.now(timezone.utc))
+
+    def alerts_covering(self, outage, extent):
+        """Ids of the alerts intersecting an outage's polygon, or its point when it has none."""
+        shape = None
+        points = geometry.polygon_points(outage.get("polygon"))
+        if len(points) >= 3:
+            shape = Polygon(points)
+            if not shape.is_valid:
+                shape = shape.envelope
+        elif extent:
+            shape = Point((extent[0] + extent[2]) / 2, (extent[1] + extent[3]) / 2)
+        if shape is None:
+            return []
+        alert_ids = []
+        for index in self._tree.query(shape):
+            alert_id = self._ids[index]
+            if alert_id not in alert_ids and self._prepared[index].intersects(shape):
+                alert_ids.append(alert_id)
+        return alert_ids
+
+
+def load_alerts(path):
+    """Build the AlertIndex of an alerts file; None without shapely or when the file can't be read."""
+    if STRtree is None:
+        return None
+    try:
+        with open(path, encoding="utf-8") as alerts_file:
+            return AlertIndex(json.load(alerts_file))
+    except (OSError, ValueError, KeyError, TypeError, GEOSException) as e:
+        print(f"Error loading weather alerts: {e}")
+        return None
+
+
+def join_outages(index, data, extents, detail_data):
+    """
+    Copies of the cached outages and of the simplified ones in detail_data ({level: rows})
+    with "alert_ids" set; the given dicts may be in use elsewhere and are left alone.
+    Returns (data, detail_data, {alert id: [outage, ...]}).
+    """
+    alert_outages = {alert_id: [] for alert_id in (index.alert_ids if index else ())}
+    joined, by_key = [], {}
+    for outage, extent in zip(data, extents):
+        try:
+            alert_ids = index.alerts_covering(outage, extent) if index else []
+        except (ValueError, TypeError, IndexError, GEOSException):
+            alert_ids = []
+        outage = {**outage, "alert_ids": alert_ids}
+        joined.append(outage)
+        by_key[(outage["power_company"], outage["id"])] = alert_ids
+        for alert_id in alert_ids:
+            alert_outages[alert_id].append(outage)
+    joined_detail = {
+        level: [{**outage, "alert_ids": by_key.get((outage["power_company"], outage["id"]), [])} for outage in rows]
+        for level, rows in detail_data.items()
+    }
+    return joined, joined_detail, alert_outages